@@ -0,0 +1,495 @@
+"""End-to-end load test of the HTTP and websocket paths
+
+Starts the app under uvicorn in a child process, then drives it from
+client processes. The clients simulate M concurrent matches of N players
+each. Every match goes through /match/create, /match/join and /match/start,
+then connects one websocket per player. Each player but one then toggles
+votingReadiness. The one holdout keeps the match in its discussion phase.
+
+Latency is measured from sending a toggle until a match_state_update
+showing it reaches each socket of the match. The report covers the p50,
+p99 and max of that latency, the messages sent and frames received per
+second, and server memory per match, taken from the server's RSS before
+and after the matches connect.
+
+With --ramp the number of matches is multiplied each step, on a fresh
+server, until p99 exceeds --slo-ms, probes time out, or --max-matches is
+reached. The first failing step is reported as the breaking point.
+
+Results are written as JSON tagged with the git commit, by default to
+benchmarks/results/ (ignored by git), so runs can be compared. The script runs the tree it sits in, and also works when copied
+into a checkout of an older commit, down to the first one:
+
+    uv sync --group bench
+    python benchmarks/loadtest.py --matches 50 --players 6 --ramp 2
+    cd benchmarks/results && python ../loadtest.py --compare BASE.json HEAD.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import uvicorn
+from websockets.asyncio.client import connect
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Settings applied to the server unless set in the environment
+SERVER_DEFAULTS = {"EVENT_LOG": "", "JOURNAL_DIR": "", "MAX_MATCHES": "1000000"}
+# Compared between result files, with whether a higher value is better
+COMPARED_METRICS = {
+    "p50_ms": False,
+    "p99_ms": False,
+    "messages_per_second": True,
+    "frames_per_second": True,
+    "memory_per_match_kb": False,
+}
+
+
+def raise_file_limit():
+    """Allow as many open sockets as the hard limit permits"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def serve(sock: socket.socket, environment: dict[str, str]):
+    """Run the app on a listening socket, quietly"""
+    os.environ.update(environment)
+    raise_file_limit()
+    from src.app import app
+
+    limits = {}
+    try:
+        from src.core.settings import WS_MAX_SIZE
+
+        limits["ws_max_size"] = WS_MAX_SIZE
+    except ImportError:
+        # Older trees have no such setting and keep uvicorn's frame limit
+        pass
+
+    server_config = uvicorn.Config(app, log_level="warning", **limits)
+    uvicorn.Server(server_config).run(sockets=[sock])
+
+
+def resident_kb(pid: int) -> int | None:
+    """Resident memory of a process in KiB, where /proc is available"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class Probe:
+    """One readiness toggle, waiting to be seen on every socket of its match"""
+
+    __slots__ = ("player_id", "value", "sent", "waiting", "done")
+
+    def __init__(self, player_id: str, value: bool, sockets: int):
+        self.player_id = player_id
+        self.value = value
+        self.sent = time.perf_counter()
+        self.waiting = set(range(sockets))
+        self.done = asyncio.Event()
+
+
+class MatchClient:
+    def __init__(self, base_url: str, players: int, interval: float, timeout: float):
+        self.base_url = base_url
+        self.players = players
+        self.interval = interval
+        self.timeout = timeout
+        self.match_code = ""
+        self.sessions: list[dict] = []
+        self.sockets: list = []
+        self.probes: dict[str, Probe] = {}
+        self.latencies: list[float] = []
+        self.sent = 0
+        self.frames = 0
+        self.timeouts = 0
+
+    async def setup(self, http: httpx.AsyncClient):
+        """Create the match, join every player, start it and connect the sockets"""
+        response = await http.post("/match/create")
+        self.match_code = response.json()["match_code"]
+        for index in range(self.players):
+            body = {"name": f"bot{index}", "match_code": self.match_code}
+            response = await http.post("/match/join", json=body)
+            response.raise_for_status()
+            self.sessions.append(response.json())
+
+        proposition = {"type": "role_proposition", "proposition": "Batman"}
+        ws_url = self.base_url.replace("http", "ws", 1)
+        for session in self.sessions:
+            url = f"{ws_url}/ws/match/{self.match_code}/{session['player_id']}"
+            # Older trees issue no session tokens
+            if session.get("session_token"):
+                url += f"?token={session['session_token']}"
+            self.sockets.append(await connect(url, max_size=None))
+        await self.sockets[0].send(json.dumps(proposition))
+        self.sent += 1
+
+        # Wait for the proposition, then start
+        await asyncio.sleep(0.05)
+        response = await http.post("/match/start", json={"match_code": self.match_code})
+        if "error" in response.json():
+            raise RuntimeError(response.json()["error"])
+
+    async def run(self, duration: float):
+        readers = [
+            asyncio.create_task(self._read(index, sock))
+            for index, sock in enumerate(self.sockets)
+        ]
+        deadline = time.perf_counter() + duration
+        # The last player never gets ready, so the match stays in discussion
+        await asyncio.gather(
+            *(
+                self._toggle(session["player_id"], sock, deadline)
+                for session, sock in zip(self.sessions[:-1], self.sockets)
+            )
+        )
+        for reader in readers:
+            reader.cancel()
+
+    async def close(self):
+        for sock in self.sockets:
+            await sock.close()
+
+    async def _toggle(self, player_id: str, sock, deadline: float):
+        value = True
+        # Spread the players of every match over the interval
+        await asyncio.sleep(random.random() * self.interval)
+        while time.perf_counter() < deadline:
+            probe = self.probes[player_id] = Probe(player_id, value, self.players)
+            await sock.send(json.dumps({"type": "votingReadiness", "value": value}))
+            self.sent += 1
+            try:
+                async with asyncio.timeout(self.timeout):
+                    await probe.done.wait()
+            except TimeoutError:
+                self.timeouts += 1
+            del self.probes[player_id]
+            value = not value
+            await asyncio.sleep(self.interval)
+
+    async def _read(self, index: int, sock):
+        async for frame in sock:
+            self.frames += 1
+            if not self.probes:
+                continue
+
+            received = time.perf_counter()
+            # Parsed rather than matched by prefix, since encoders differ between trees
+            message = json.loads(frame)
+            if message.get("type") != "match_state_update":
+                continue
+
+            ready = {
+                player["id"]: player["ready_to_vote"] for player in message["players"]
+            }
+            for probe in list(self.probes.values()):
+                if index in probe.waiting and ready.get(probe.player_id) == probe.value:
+                    self.latencies.append(received - probe.sent)
+                    probe.waiting.discard(index)
+                    if not probe.waiting:
+                        probe.done.set()
+
+
+async def drive(
+    base_url: str,
+    matches: int,
+    options: dict,
+    barrier: multiprocessing.Barrier,
+) -> dict:
+    """Set up this process's matches, then run them once every process is ready"""
+    clients = [
+        MatchClient(
+            base_url, options["players"], options["interval"], options["timeout"]
+        )
+        for _ in range(matches)
+    ]
+    errors = 0
+    limits = httpx.Limits(max_connections=64)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+        setups = await asyncio.gather(
+            *(client.setup(http) for client in clients), return_exceptions=True
+        )
+    ready = []
+    for client, setup in zip(clients, setups):
+        if isinstance(setup, BaseException):
+            errors += 1
+        else:
+            ready.append(client)
+
+    # Wait for every process to finish setting up, while memory is measured
+    await asyncio.to_thread(barrier.wait)
+    await asyncio.to_thread(barrier.wait)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client.run(options["duration"]) for client in ready))
+    elapsed = time.perf_counter() - started
+    await asyncio.gather(*(client.close() for client in ready), return_exceptions=True)
+
+    return {
+        "latencies": [latency for client in ready for latency in client.latencies],
+        "sent": sum(client.sent for client in ready),
+        "frames": sum(client.frames for client in ready),
+        "timeouts": sum(client.timeouts for client in ready),
+        "errors": errors,
+        "seconds": elapsed,
+    }
+
+
+def client_process(base_url, matches, options, barrier, results):
+    raise_file_limit()
+    results.put(asyncio.run(drive(base_url, matches, options, barrier)))
+
+
+def wait_until_serving(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(base_url + "/").status_code == 200:
+                return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError("The server did not start")
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_step(matches: int, options: dict) -> dict:
+    """Run one load level against a fresh server"""
+    context = multiprocessing.get_context("spawn")
+    environment = {
+        name: os.environ.get(name, value) for name, value in SERVER_DEFAULTS.items()
+    }
+    sock = socket.create_server(("127.0.0.1", 0), backlog=4096)
+    base_url = "http://127.0.0.1:%d" % sock.getsockname()[1]
+    server = context.Process(target=serve, args=(sock, environment), daemon=True)
+    server.start()
+
+    try:
+        wait_until_serving(base_url)
+        baseline_kb = resident_kb(server.pid)
+
+        processes = min(options["client_processes"], matches)
+        barrier = context.Barrier(processes + 1)
+        results = context.Queue()
+        shares = [
+            matches // processes + (i < matches % processes) for i in range(processes)
+        ]
+        clients = [
+            context.Process(
+                target=client_process,
+                args=(base_url, share, options, barrier, results),
+                daemon=True,
+            )
+            for share in shares
+        ]
+        for client in clients:
+            client.start()
+
+        barrier.wait()
+        loaded_kb = resident_kb(server.pid)
+        barrier.wait()
+
+        outcomes = [results.get() for _ in clients]
+        for client in clients:
+            client.join()
+    finally:
+        server.terminate()
+        server.join()
+        sock.close()
+
+    latencies = sorted(
+        latency for outcome in outcomes for latency in outcome["latencies"]
+    )
+    seconds = max(outcome["seconds"] for outcome in outcomes)
+    memory_per_match = None
+    if baseline_kb is not None and loaded_kb is not None:
+        memory_per_match = round((loaded_kb - baseline_kb) / matches, 2)
+
+    return {
+        "matches": matches,
+        "players": options["players"],
+        "probes": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000 if latencies else 0.0, 3),
+        "messages_per_second": round(
+            sum(outcome["sent"] for outcome in outcomes) / seconds, 1
+        ),
+        "frames_per_second": round(
+            sum(outcome["frames"] for outcome in outcomes) / seconds, 1
+        ),
+        "memory_per_match_kb": memory_per_match,
+        "timeouts": sum(outcome["timeouts"] for outcome in outcomes),
+        "errors": sum(outcome["errors"] for outcome in outcomes),
+    }
+
+
+def step_failed(step: dict, slo_ms: float) -> bool:
+    attempts = step["probes"] + step["timeouts"]
+    return (
+        step["errors"] > 0
+        or step["p99_ms"] > slo_ms
+        or step["timeouts"] > 0.01 * max(attempts, 1)
+    )
+
+
+def git_commit() -> dict:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+
+    return {
+        "sha": git("rev-parse", "HEAD") or "unknown",
+        "subject": git("log", "-1", "--format=%s"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
+
+
+def print_step(step: dict):
+    print(
+        f"{step['matches']:>6} matches x {step['players']} players: "
+        f"p50 {step['p50_ms']:.2f}ms p99 {step['p99_ms']:.2f}ms "
+        f"max {step['max_ms']:.2f}ms, {step['messages_per_second']:.0f} msg/s, "
+        f"{step['frames_per_second']:.0f} frames/s, "
+        f"{step['memory_per_match_kb']} KiB/match, "
+        f"{step['timeouts']} timeouts, {step['errors']} errors"
+    )
+
+
+def compare(base_path: str, head_path: str):
+    """Print the change of every metric between two result files"""
+    runs = []
+    for path in (base_path, head_path):
+        with open(path) as result_file:
+            runs.append(json.load(result_file))
+    base, head = runs
+    print(f"base {base['commit']['sha'][:10]} {base['commit']['subject']}")
+    print(f"head {head['commit']['sha'][:10]} {head['commit']['subject']}")
+
+    base_steps = {(step["matches"], step["players"]): step for step in base["steps"]}
+    for step in head["steps"]:
+        before = base_steps.get((step["matches"], step["players"]))
+        if before is None:
+            continue
+        print(f"{step['matches']} matches x {step['players']} players")
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = before[metric], step[metric]
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            better = (change > 0) == higher_is_better
+            verdict = "" if abs(change) < 5 else (" better" if better else " worse")
+            print(f"  {metric:<22}{old:>12.2f}{new:>12.2f}{change:>+9.1f}%{verdict}")
+
+    print(
+        f"breaking point: {base['breaking_point'] or 'not reached'} -> "
+        f"{head['breaking_point'] or 'not reached'}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--matches", type=int, default=20)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="seconds of load per step"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=0.5, help="seconds between a player's toggles"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=5.0, help="seconds before a probe is lost"
+    )
+    parser.add_argument("--client-processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--ramp", type=float, default=0, help="multiply matches by this each step"
+    )
+    parser.add_argument("--max-matches", type=int, default=5000)
+    parser.add_argument(
+        "--slo-ms", type=float, default=100.0, help="p99 above this breaks a step"
+    )
+    parser.add_argument(
+        "--out", help="result file (default benchmarks/results/<sha>.json)"
+    )
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BASE", "HEAD"), help="compare two result files"
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.players < 3:
+        parser.error("a match needs at least 3 players")
+
+    options = {
+        "players": args.players,
+        "duration": args.duration,
+        "interval": args.interval,
+        "timeout": args.timeout,
+        "client_processes": max(1, args.client_processes),
+    }
+    steps = []
+    breaking_point = None
+    matches = args.matches
+    while matches <= args.max_matches:
+        step = run_step(matches, options)
+        steps.append(step)
+        print_step(step)
+        if step_failed(step, args.slo_ms):
+            breaking_point = matches
+            break
+        if args.ramp <= 1:
+            break
+        matches = max(matches + 1, int(matches * args.ramp))
+
+    commit = git_commit()
+    result = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {**options, "slo_ms": args.slo_ms, "ramp": args.ramp},
+        "server": {
+            name: os.environ.get(name, value) for name, value in SERVER_DEFAULTS.items()
+        },
+        "steps": steps,
+        "breaking_point": breaking_point,
+    }
+    out = Path(
+        args.out or ROOT / "benchmarks" / "results" / f"{commit['sha'][:10]}.json"
+    )
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2) + "\n")
+    print(f"breaking point: {breaking_point or 'not reached'}; results in {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Headless, deterministic game simulator for benchmarking the game rules
+
+Plays complete games in one process through the same code paths as the
+server: RoleManager, PhaseManager and VoteManager apply every command, and
+phase deadlines fire from the scheduler. Games run one at a time, so each
+command is applied and its state broadcast flushed directly, as the match
+actor would, without a mailbox. No sockets are opened, so broadcasts cost
+nothing beyond the rules themselves. The scheduler runs on a virtual clock,
+so timed-out discussions and votes take no real time.
+
+Bots propose roles, mark themselves ready and vote at random, sometimes
+retracting a vote or sitting a phase out until its deadline, which covers
+ties, timeouts and both win conditions. The same seed plays the same games,
+which the printed digest confirms.
+
+    python benchmarks/simulate.py --games 5000 --players 6 --seed 1
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+ROLE_NAMES = ("Batman", "Shakira", "Messi", "Frida Kahlo", "Pikachu", "Cleopatra")
+
+
+class VirtualClock:
+    """Scheduler clock that only moves when the simulation advances it"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class PhaseCosts:
+    """Time spent applying commands, by the phase the match was in"""
+
+    def __init__(self):
+        self.commands: dict[str, int] = {}
+        self.seconds: dict[str, float] = {}
+
+    def add(self, phase: str, seconds: float):
+        self.commands[phase] = self.commands.get(phase, 0) + 1
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+
+    def report(self) -> dict[str, dict]:
+        total = sum(self.seconds.values()) or 1.0
+        return {
+            phase: {
+                "commands": self.commands[phase],
+                "seconds": round(seconds, 6),
+                "us_per_command": round(seconds / self.commands[phase] * 1e6, 2),
+                "share": round(seconds / total, 4),
+            }
+            for phase, seconds in self.seconds.items()
+        }
+
+
+class Simulation:
+    def __init__(self, seed: int, players: int, clock: VirtualClock):
+        from src.game.chance import rng
+
+        # The rules and the bots draw from separate streams, both seeded
+        rng.seed(seed)
+        self.bots = random.Random(f"bots-{seed}")
+        self.players = players
+        self.clock = clock
+        self.costs = PhaseCosts()
+        self.digest = hashlib.sha256()
+        self.winners: dict[str, int] = {}
+        self.rounds = 0
+        # Timer callbacks handed over by the scheduler, applied by advance()
+        self.due: list = []
+
+    def dispatch(self, match_code: str, callback):
+        self.due.append(callback)
+
+    async def apply(self, match_code: str, command):
+        """Apply a command and flush its state broadcast, timing both"""
+        from src.core.state import matches
+        from src.core.websocket import WebSocketManager
+
+        phase = matches[match_code].phase
+        started = time.perf_counter()
+        result = await command()
+        WebSocketManager.flush_match_state(match_code)
+        self.costs.add(phase, time.perf_counter() - started)
+        return result
+
+    async def advance(self, match_code: str):
+        """Move the clock to the next deadline and apply the timers due by then"""
+        from src.core.scheduler import scheduler
+
+        self.clock.now = max(self.clock.now, scheduler.next_deadline())
+        await scheduler.run_due()
+        due, self.due = self.due, []
+        for callback in due:
+            await self.apply(match_code, callback)
+
+    async def play(self) -> str:
+        """Play one game from creation to game over, then drop the match"""
+        from src.core.eviction import EvictionManager
+        from src.core.match import MatchManager
+        from src.core.scheduler import scheduler
+        from src.core.state import matches
+        from src.game import PhaseManager, RoleManager, VoteManager
+        from src.game.phases import DISCUSSION_PHASES
+
+        match_code = MatchManager.create_match()
+        match = matches[match_code]
+        for index in range(self.players):
+            join = partial(MatchManager.join_match, match_code, f"bot{index}")
+            await self.apply(match_code, join)
+
+        player_ids = list(match.players)
+        for player_id in player_ids:
+            if self.bots.random() < 0.6:
+                role = self.bots.choice(ROLE_NAMES)
+                propose = partial(
+                    RoleManager.handle_role_proposition, match_code, player_id, role
+                )
+                await self.apply(match_code, propose)
+        if not match.can_start:
+            propose = partial(
+                RoleManager.handle_role_proposition,
+                match_code,
+                player_ids[0],
+                ROLE_NAMES[0],
+            )
+            await self.apply(match_code, propose)
+        await self.apply(
+            match_code, partial(RoleManager.assign_roles_and_start, match_code)
+        )
+
+        while match.phase != "game_over":
+            phase = match.phase
+            alive = [pid for pid in player_ids if match.players[pid].alive]
+            self.bots.shuffle(alive)
+
+            if phase in DISCUSSION_PHASES:
+                for player_id in alive:
+                    if self.bots.random() < 0.9 and match.phase == phase:
+                        ready = partial(
+                            PhaseManager.handle_voting_readiness,
+                            match_code,
+                            player_id,
+                            True,
+                        )
+                        await self.apply(match_code, ready)
+            elif phase == "voting":
+                for player_id in alive:
+                    if self.bots.random() >= 0.9 or match.phase != phase:
+                        continue
+                    target = self.bots.choice(
+                        [pid for pid in alive if pid != player_id]
+                    )
+                    vote = partial(
+                        VoteManager.handle_vote, match_code, player_id, target
+                    )
+                    await self.apply(match_code, vote)
+                    if self.bots.random() < 0.05 and match.phase == phase:
+                        retract = partial(
+                            VoteManager.handle_vote_retraction, match_code, player_id
+                        )
+                        await self.apply(match_code, retract)
+
+            if match.phase == phase and match.phase != "game_over":
+                if scheduler.pending(match_code):
+                    await self.advance(match_code)
+                else:
+                    # No deadline configured for this phase, so the idle bots act
+                    await self.finish_phase(match_code, alive)
+
+        winner = "impostor" if match.alive_impostors else "normal"
+        self.winners[winner] = self.winners.get(winner, 0) + 1
+        self.rounds += match.round
+        eliminated = [
+            match.players[pid].role
+            for pid in player_ids
+            if not match.players[pid].alive
+        ]
+        self.digest.update(json.dumps([winner, match.round, eliminated]).encode())
+
+        # Finished games are reaped as idle by the server too
+        EvictionManager.evict_match(match_code)
+        return winner
+
+    async def finish_phase(self, match_code: str, alive: list[str]):
+        from src.core.state import matches
+        from src.game import PhaseManager, VoteManager
+
+        match = matches[match_code]
+        phase = match.phase
+        for player_id in alive:
+            if match.phase != phase:
+                return
+            if phase == "voting":
+                if player_id not in match.votes:
+                    target = self.bots.choice(
+                        [pid for pid in alive if pid != player_id]
+                    )
+                    vote = partial(
+                        VoteManager.handle_vote, match_code, player_id, target
+                    )
+                    await self.apply(match_code, vote)
+            elif not match.players[player_id].ready_to_vote:
+                ready = partial(
+                    PhaseManager.handle_voting_readiness, match_code, player_id, True
+                )
+                await self.apply(match_code, ready)
+
+
+async def simulate(games: int, players: int, seed: int) -> dict:
+    from src.core.scheduler import scheduler
+
+    clock = VirtualClock()
+    simulation = Simulation(seed, players, clock)
+    scheduler.clock = clock
+    scheduler.dispatch = simulation.dispatch
+
+    started = time.perf_counter()
+    for _ in range(games):
+        await simulation.play()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "games": games,
+        "players": players,
+        "seed": seed,
+        "seconds": round(elapsed, 4),
+        "games_per_second": round(games / elapsed, 1),
+        "rounds_per_game": round(simulation.rounds / games, 3),
+        "winners": simulation.winners,
+        "phases": simulation.costs.report(),
+        "digest": simulation.digest.hexdigest()[:16],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    if args.players < 3:
+        parser.error("a game needs at least 3 players")
+
+    # Settings are read on import. Deadlines make idle bots time out, which
+    # costs nothing on the virtual clock
+    os.environ.setdefault("EVENT_LOG", "")
+    os.environ.setdefault("JOURNAL_DIR", "")
+    os.environ.setdefault("DISCUSSION_TIME_LIMIT", "120")
+    os.environ.setdefault("VOTE_TIME_LIMIT", "60")
+    os.environ.setdefault("CODE_SEED", str(args.seed))
+
+    report = asyncio.run(simulate(args.games, args.players, args.seed))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(
+        f"{report['games']} games of {report['players']} players in "
+        f"{report['seconds']}s: {report['games_per_second']} games/s, "
+        f"{report['rounds_per_game']} rounds/game, winners {report['winners']}"
+    )
+    print(f"{'phase':<16}{'commands':>10}{'seconds':>10}{'us/cmd':>10}{'share':>8}")
+    for phase, cost in report["phases"].items():
+        print(
+            f"{phase:<16}{cost['commands']:>10}{cost['seconds']:>10.3f}"
+            f"{cost['us_per_command']:>10.1f}{cost['share']:>8.1%}"
+        )
+    print(f"digest {report['digest']} (equal for equal seeds and settings)")
+
+
+if __name__ == "__main__":
+    main()
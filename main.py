@@ -1,8 +1,79 @@
+import asyncio
+import multiprocessing
+import os
+import secrets
+import socket
+import sys
+import threading
+
 import uvicorn
 from decouple import config
-from src.app import app
 
-if __name__ == "__main__":
+
+def serve_worker(sock: socket.socket, worker_id: int, environment: dict[str, str]):
+    """Run one uvicorn worker on a shared listening socket"""
+    # Settings are read on import, so configure the worker before importing the app
+    os.environ.update(environment, WORKER_ID=str(worker_id))
+    from src.app import app
+    from src.core.settings import WS_MAX_SIZE
+
+    server_config = uvicorn.Config(app, ws_max_size=WS_MAX_SIZE)
+    uvicorn.Server(server_config).run(sockets=[sock])
+
+
+def start_hub() -> str:
+    """Run a bus hub for the local workers in a background thread"""
+    from src.core.bus import BusHub
+
+    hub_socket = socket.create_server(("127.0.0.1", 0))
+    host, port = hub_socket.getsockname()
+    thread = threading.Thread(
+        target=asyncio.run, args=(BusHub().serve(sock=hub_socket),), daemon=True
+    )
+    thread.start()
+    return f"tcp://{host}:{port}"
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["hub"]:
+    # Standalone hub for workers spread over several nodes
+    from src.core.bus import BusHub
+
+    hub_host = sys.argv[2] if len(sys.argv) > 2 else "0.0.0.0"
+    hub_port = int(sys.argv[3]) if len(sys.argv) > 3 else 7000
+    asyncio.run(BusHub().serve(hub_host, hub_port))
+elif __name__ == "__main__":
     host: str = str(config("HOST", default="0.0.0.0"))
-    port: int = config("PORT", default=8000)
-    uvicorn.run(app, host=host, port=port)
+    port: int = config("PORT", default=8000, cast=int)
+    workers: int = config("WORKERS", default=1, cast=int)
+
+    if workers <= 1:
+        from src.app import app
+        from src.core.settings import WS_MAX_SIZE
+
+        uvicorn.run(app, host=host, port=port, ws_max_size=WS_MAX_SIZE)
+    else:
+        # Worker ids of this node start at WORKER_ID; WORKER_COUNT counts all nodes
+        first_worker: int = config("WORKER_ID", default=0, cast=int)
+        bus_url: str = config("BUS_URL", default="")
+        code_seed: str = config("CODE_SEED", default="")
+        if bus_url and not code_seed:
+            # Workers on other nodes could never agree on a seed made up here
+            sys.exit("BUS_URL requires CODE_SEED, the same on every node")
+        environment = {
+            "WORKER_COUNT": str(config("WORKER_COUNT", default=workers, cast=int)),
+            "BUS_URL": bus_url or start_hub(),
+            "CODE_SEED": code_seed or secrets.token_hex(16),
+        }
+
+        sock = socket.create_server((host, port))
+        context = multiprocessing.get_context("spawn")
+        processes = [
+            context.Process(
+                target=serve_worker, args=(sock, first_worker + index, environment)
+            )
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
@@ -1,17 +1,91 @@
+import asyncio
 import json
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import logging
+import secrets
+import time
+from contextlib import asynccontextmanager
+from fastapi import (
+    FastAPI,
+    Header,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-from .models import JoinMatchRequest, StartMatchRequest
+from .models import (
+    CreateMatchRequest,
+    JoinMatchRequest,
+    QuickMatchRequest,
+    StartMatchRequest,
+)
 from .core import (
     WebSocketManager,
     MatchManager,
-    active_connections,
-    websocket_to_player,
+    EvictionManager,
+    ClusterManager,
+    HeartbeatManager,
+    matches,
+)
+from .core import metrics
+from .core.drain import drain
+from .core.eviction import MATCH_EXPIRED_CLOSE_CODE
+from .core.events import event_log
+from .core.journal import journal
+from .core.settings import (
+    ADMIN_TOKEN,
+    CLUSTER_CALL_TIMEOUT,
+    LOBBY_MAX_OFFSET,
+    LOBBY_PAGE_LIMIT,
+    LONG_POLL_MAX_WAIT,
+    MAX_FRAME_BYTES,
+    MAX_PROPOSITION_LENGTH,
 )
 from .game import VoteManager, RoleManager, PhaseManager
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# Close code for sockets presenting the wrong session token
+INVALID_SESSION_CLOSE_CODE = 4401
+# Close code for spectators of a match that does not exist
+MATCH_NOT_FOUND_CLOSE_CODE = 4404
+# Close code for players of a match handed off to another process; they reconnect
+SERVICE_RESTART_CLOSE_CODE = 1012
+# Lobbies tried by a quick match before giving up
+QUICK_MATCH_ATTEMPTS = 3
+
+
+def _resume(match_codes: list[str]):
+    """Restart the timers of matches loaded from elsewhere"""
+    for match_code in match_codes:
+        MatchManager.resume(match_code)
+        PhaseManager.resume(match_code)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    _resume(journal.restore())
+    _resume(drain.import_file())
+    journal.start()
+    drain.install_signal_handlers()
+    snapshots = asyncio.create_task(journal.run_snapshots())
+
+    await ClusterManager.start()
+    reaper = asyncio.create_task(EvictionManager.run_reaper())
+    heartbeats = asyncio.create_task(HeartbeatManager.run_heartbeats())
+    yield
+    reaper.cancel()
+    heartbeats.cancel()
+    snapshots.cancel()
+    await ClusterManager.stop()
+    journal.snapshot()
+    journal.close()
+    event_log.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,44 +93,207 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 
 @app.get("/")
-async def root():
+async def root(response: Response):
+    if drain.draining:
+        # Take this worker out of load balancer rotation
+        response.status_code = 503
+        return {"status": "draining"}
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Metrics of this worker in the Prometheus text format"""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.post("/match/create")
-async def create_match():
-    """Generate and return a match code, creating a new match entry"""
-    match_code = MatchManager.create_match()
+async def create_match(request: CreateMatchRequest | None = None):
+    """Generate and return a match code, creating a new match entry
+
+    Public matches are listed in /lobbies and filled by /match/quick.
+    """
+    if drain.draining:
+        return _draining_error()
+
+    public = request is not None and request.public
+    match_code = MatchManager.create_match(public)
     return {"match_code": match_code}
 
 
+@app.get("/lobbies")
+async def list_lobbies(response: Response, offset: int = 0, limit: int = 20):
+    """Open public lobbies across every worker, fullest first
+
+    Paging stops at LOBBY_MAX_OFFSET; deeper lobbies are reached as the
+    fuller ones start or fill up.
+    """
+    if offset > LOBBY_MAX_OFFSET:
+        response.status_code = 400
+        return {"error": f"offset must be at most {LOBBY_MAX_OFFSET}"}
+
+    limit = min(max(limit, 1), LOBBY_PAGE_LIMIT)
+    offset = max(offset, 0)
+    pages = await ClusterManager.gather("lobbies", offset + limit)
+    result = MatchManager.merge_lobby_pages(pages, offset, limit)
+    if result["next_offset"] is not None and result["next_offset"] > LOBBY_MAX_OFFSET:
+        result["next_offset"] = None
+    return result
+
+
+@app.post("/match/quick")
+async def quick_match(request: QuickMatchRequest, response: Response):
+    """Join the fullest open public lobby, or a new public match if there is none"""
+    if drain.draining:
+        return _draining_error()
+
+    for _ in range(QUICK_MATCH_ATTEMPTS):
+        # The lobby may fill up or start before the join is applied; then retry
+        match_code = await _fullest_lobby() or MatchManager.create_match(public=True)
+        status, result = await ClusterManager.call(
+            match_code, "join", match_code, request.name
+        )
+        if status == 200 and "error" not in result:
+            return {"match_code": match_code, **result}
+
+    response.status_code = 503
+    return {"error": "No lobby could be joined, try again"}
+
+
+def _draining_error() -> Response:
+    return JSONResponse({"error": "Server is draining"}, status_code=503)
+
+
+@app.post("/admin/drain")
+async def start_drain(authorization: str | None = Header(default=None)):
+    """Stop creating matches and keep players through disconnects"""
+    error = _admin_error(authorization)
+    if error is not None:
+        return error
+
+    drain.start("admin")
+    return {"draining": True, "matches": len(matches)}
+
+
+@app.get("/admin/export")
+async def export_matches(authorization: str | None = Header(default=None)):
+    """Hand every match of this worker off, as gzipped JSON for /admin/import
+
+    This worker stops applying changes to the exported matches.
+    """
+    error = _admin_error(authorization)
+    if error is not None:
+        return error
+
+    return Response(drain.export(), media_type="application/gzip")
+
+
+@app.post("/admin/import")
+async def import_matches(
+    request: Request, authorization: str | None = Header(default=None)
+):
+    """Take over the matches exported by another process
+
+    Players reattach with their session tokens within RECONNECT_GRACE.
+    """
+    error = _admin_error(authorization)
+    if error is not None:
+        return error
+
+    try:
+        imported, skipped = drain.import_state(await request.body())
+    except (OSError, ValueError, KeyError) as exc:
+        return JSONResponse({"error": f"Invalid export: {exc}"}, status_code=400)
+
+    _resume(imported)
+    return {"imported": len(imported), "skipped": skipped}
+
+
+def _admin_error(authorization: str | None) -> Response | None:
+    """Response refusing an admin request, or None if its token is valid"""
+    if not ADMIN_TOKEN:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    if authorization is None or not secrets.compare_digest(
+        authorization.encode(), f"Bearer {ADMIN_TOKEN}".encode()
+    ):
+        return JSONResponse({"error": "Invalid admin token"}, status_code=403)
+    return None
+
+
+async def _fullest_lobby() -> str | None:
+    """Code of the open public lobby with the most players on any worker"""
+    pages = await ClusterManager.gather("lobbies", 1)
+    fullest = [page["lobbies"][0] for page in pages if page["lobbies"]]
+    if not fullest:
+        return None
+    return max(fullest, key=lambda lobby: lobby["players"])["match_code"]
+
+
 @app.post("/match/join")
-async def join_match(request: JoinMatchRequest):
+async def join_match(request: JoinMatchRequest, response: Response):
     """Add a player to a match and return the player id"""
-    result = await MatchManager.join_match(request.match_code, request.name)
-    if result is None:
-        return {"error": "Match not found"}
+    status, result = await ClusterManager.call(
+        request.match_code, "join", request.match_code, request.name
+    )
+    response.status_code = status
     return result
 
 
 @app.post("/match/start")
 async def start_match(request: StartMatchRequest):
     """Assign roles and start the match"""
-    return await RoleManager.assign_roles_and_start(request.match_code)
+    return await ClusterManager.call(request.match_code, "start", request.match_code)
 
 
 @app.get("/match/{match_code}/state")
-async def get_match_state(match_code: str):
-    """Get the current state of a match for manual lobby refresh"""
-    match_info = MatchManager.get_match_info(match_code)
-    if not match_info:
-        return {"error": "Match not found"}
+async def get_match_state(
+    match_code: str,
+    response: Response,
+    wait: float = 0,
+    if_none_match: str | None = Header(default=None),
+):
+    """Get the current state of a match for manual lobby refresh
 
-    return match_info
+    Answers 304 when If-None-Match holds the current ETag. With wait, an
+    unchanged state is held for up to that many seconds until it changes.
+    """
+    wait = min(wait, LONG_POLL_MAX_WAIT)
+    status, etag, result = await ClusterManager.call(
+        match_code,
+        "state",
+        match_code,
+        wait,
+        if_none_match,
+        timeout=CLUSTER_CALL_TIMEOUT + max(wait, 0),
+    )
+    if etag is None:
+        response.status_code = status
+        return result
+
+    headers = {"ETag": etag}
+    if status == 304:
+        return Response(status_code=304, headers=headers)
+
+    return Response(result, media_type="application/json", headers=headers)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Check an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
 
 
 @app.websocket("/ws/match/{code}/{player_id}")
@@ -64,54 +301,294 @@ async def websocket_endpoint(websocket: WebSocket, code: str, player_id: str):
     """WebSocket endpoint for match communication"""
     await websocket.accept()
 
-    print(f"Client connected to match: {code}, player: {player_id}")
-
-    if code not in active_connections:
-        active_connections[code] = []
-    active_connections[code].append(websocket)
+    session_token = websocket.query_params.get("token")
+    status = await ClusterManager.call(code, "attach", code, player_id, session_token)
+    if status == "expired":
+        await websocket.close(MATCH_EXPIRED_CLOSE_CODE, "Match expired")
+        return
+    if status == "denied":
+        await websocket.close(INVALID_SESSION_CLOSE_CODE, "Invalid session token")
+        return
+    if status == "moved":
+        await websocket.close(SERVICE_RESTART_CLOSE_CODE, "Match moved, reconnect")
+        return
 
-    websocket_to_player[websocket] = {"match_code": code, "player_id": player_id}
+    event_log.emit("connected", match=code, player=player_id)
 
+    delta = websocket.query_params.get("updates") == "delta"
+    connection = None
+    # From here on the player counts this socket, so always reach the finally
     try:
+        connection = WebSocketManager.connect(websocket, code, player_id, delta)
+        if delta:
+            await _send_match_state(connection)
+
         while True:
-            data = await websocket.receive_text()
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            connection.last_seen = time.monotonic()
+
+            # Cheapest checks first, so rejected messages cost as little as possible
+            if not connection.inbound.take():
+                connection.reject("rate_limited")
+                continue
+
+            data = frame.get("text")
+            if data is None:
+                connection.reject("binary_frame")
+                continue
+
+            # A character takes at most 4 bytes, so short messages skip encoding
+            if len(data) * 4 > MAX_FRAME_BYTES and len(data.encode()) > MAX_FRAME_BYTES:
+                connection.reject("message_too_large")
+                continue
 
             try:
                 message = json.loads(data)
-                message_type = message.get("type")
-
-                if message_type == "votingReadiness":
-                    readiness = message.get("value", False)
-                    await PhaseManager.handle_voting_readiness(
-                        code, player_id, readiness
-                    )
-                elif message_type == "vote":
-                    target_id = message.get("target")
-                    if target_id:
-                        await VoteManager.handle_vote(code, player_id, target_id)
-                elif message_type == "role_proposition":
-                    proposition = message.get("proposition", "")
-                    await RoleManager.handle_role_proposition(
-                        code, player_id, proposition
-                    )
-                else:
-                    await websocket.send_text(data)
-
             except json.JSONDecodeError:
-                await websocket.send_text(data)
+                connection.reject("invalid_json")
+                continue
+
+            error = _message_error(message)
+            if error:
+                connection.reject(error)
+                continue
+            connection.warned = False
+
+            if message["type"] == "resync":
+                await _send_match_state(connection)
+            elif message["type"] != "pong":
+                try:
+                    await ClusterManager.call(code, "message", code, player_id, message)
+                except Exception:
+                    # One failed message must not cost the player their socket
+                    logger.exception("Handling a %s message failed", message["type"])
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Also reached when the writer closed a dead or lagging socket first
+        if connection is not None:
+            WebSocketManager.disconnect(connection)
+        # While draining, players keep their seats for the replacement process
+        if not drain.draining:
+            await ClusterManager.call(code, "leave", code, player_id)
+        event_log.emit("disconnected", match=code, player=player_id)
+
+
+@app.websocket("/ws/spectate/{code}")
+async def spectate_endpoint(websocket: WebSocket, code: str):
+    """Read-only stream of a match's public frames, for audiences of any size
+
+    Spectators get the match state followed by every broadcast to the
+    match, never a private message such as a role assignment. Anything
+    they send is ignored.
+    """
+    await websocket.accept()
+
+    # Follow the feed before fetching the state, so no frame falls in between
+    feed = WebSocketManager.add_spectator(code)
+    cursor = feed.position()
+    writer = None
+    try:
+        state = await ClusterManager.call(code, "state_frame", code)
+        if state is None:
+            await websocket.close(MATCH_NOT_FOUND_CLOSE_CODE, "Match not found")
+            return
 
+        writer = asyncio.create_task(feed.follow(websocket, cursor, state))
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
     except WebSocketDisconnect:
-        player_info = websocket_to_player.get(websocket)
-        if player_info:
-            await MatchManager.reassign_host_if_needed(
-                player_info["match_code"], player_info["player_id"]
-            )
-            del websocket_to_player[websocket]
-
-        if code in active_connections:
-            active_connections[code].remove(websocket)
-            if not active_connections[code]:
-                del active_connections[code]
-
-        await WebSocketManager.broadcast_match_state(code)
-        print(f"Client disconnected from match: {code}, player: {player_id}")
+        pass
+    finally:
+        if writer is not None:
+            writer.cancel()
+        WebSocketManager.remove_spectator(feed)
+
+
+def _message_error(message) -> str | None:
+    """Reason to refuse a websocket message, or None if it is well formed"""
+    if not isinstance(message, dict):
+        return "invalid_message"
+
+    message_type = message.get("type")
+    if message_type not in LOCAL_MESSAGE_TYPES and message_type not in MESSAGE_HANDLERS:
+        return "unknown_type"
+
+    validator = MESSAGE_VALIDATORS.get(message_type)
+    if validator is not None:
+        return validator(message)
+    return None
+
+
+def _proposition_error(message: dict) -> str | None:
+    proposition = message.get("proposition", "")
+    if not isinstance(proposition, str):
+        return "invalid_message"
+    if len(proposition) > MAX_PROPOSITION_LENGTH:
+        return "proposition_too_long"
+    return None
+
+
+def _vote_error(message: dict) -> str | None:
+    if not isinstance(message.get("target"), str):
+        return "invalid_message"
+    return None
+
+
+def _voting_readiness_error(message: dict) -> str | None:
+    if not isinstance(message.get("value", False), bool):
+        return "invalid_message"
+    return None
+
+
+async def _send_match_state(connection):
+    """Send the full match state to one client"""
+    frame = await ClusterManager.call(
+        connection.match_code, "state_frame", connection.match_code
+    )
+    if frame is not None:
+        connection.send(frame)
+
+
+# Operations on a match, run by the worker that owns it
+
+
+async def _join(match_code: str, name: str) -> tuple[int, dict]:
+    if EvictionManager.is_evicted(match_code):
+        return 410, {"error": "Match expired"}
+    if drain.handed_off:
+        return 503, {"error": "Match moved, try again"}
+
+    MatchManager.touch(match_code)
+    result = await MatchManager.join_match(match_code, name)
+    if result is None:
+        return 200, {"error": "Match not found"}
+    return 200, result
+
+
+async def _start(match_code: str) -> dict:
+    if drain.handed_off:
+        return {"error": "Match moved, try again"}
+
+    MatchManager.touch(match_code)
+    return await RoleManager.assign_roles_and_start(match_code)
+
+
+async def _state(
+    match_code: str, wait: float, if_none_match: str | None
+) -> tuple[int, str | None, str | dict | None]:
+    """Returns the status, the ETag (None on errors) and the body"""
+    snapshot = MatchManager.get_snapshot(match_code)
+    if snapshot and wait > 0 and _etag_matches(if_none_match, snapshot.etag):
+        await WebSocketManager.wait_for_state_change(match_code, snapshot.version, wait)
+        snapshot = MatchManager.get_snapshot(match_code)
+
+    if EvictionManager.is_evicted(match_code):
+        return 410, None, {"error": "Match expired"}
+
+    if snapshot is None:
+        return 200, None, {"error": "Match not found"}
+
+    if _etag_matches(if_none_match, snapshot.etag):
+        return 304, snapshot.etag, None
+    return 200, snapshot.etag, snapshot.body.decode()
+
+
+async def _lobbies(limit: int) -> dict:
+    """The fullest open public lobbies of this worker, and how many it has"""
+    return MatchManager.list_lobbies(0, limit)
+
+
+async def _attach(match_code: str, player_id: str, session_token: str | None) -> str:
+    if EvictionManager.is_evicted(match_code):
+        return "expired"
+    if drain.handed_off:
+        return "moved"
+    if not MatchManager.attach(match_code, player_id, session_token):
+        return "denied"
+    return "ok"
+
+
+async def _state_frame(match_code: str) -> str | None:
+    return WebSocketManager.get_state_frame(match_code)
+
+
+async def _on_voting_readiness(match_code: str, player_id: str, message: dict):
+    readiness = message.get("value", False)
+    await PhaseManager.handle_voting_readiness(match_code, player_id, readiness)
+
+
+async def _on_vote(match_code: str, player_id: str, message: dict):
+    target_id = message.get("target")
+    if target_id:
+        await VoteManager.handle_vote(match_code, player_id, target_id)
+
+
+async def _on_retract_vote(match_code: str, player_id: str, message: dict):
+    await VoteManager.handle_vote_retraction(match_code, player_id)
+
+
+async def _on_role_proposition(match_code: str, player_id: str, message: dict):
+    proposition = message.get("proposition", "")
+    await RoleManager.handle_role_proposition(match_code, player_id, proposition)
+
+
+# Websocket message types answered by the worker holding the socket
+LOCAL_MESSAGE_TYPES = ("resync", "pong")
+# Websocket message types handled by the worker owning the match
+MESSAGE_HANDLERS = {
+    "votingReadiness": _on_voting_readiness,
+    "vote": _on_vote,
+    "retract_vote": _on_retract_vote,
+    "role_proposition": _on_role_proposition,
+}
+_handler_seconds = {
+    message_type: metrics.HANDLER_SECONDS.labels(message_type)
+    for message_type in MESSAGE_HANDLERS
+}
+# Checked before a message is dispatched. Each returns why it is refused, if it is
+MESSAGE_VALIDATORS = {
+    "role_proposition": _proposition_error,
+    "vote": _vote_error,
+    "votingReadiness": _voting_readiness_error,
+}
+
+
+async def _handle_message(match_code: str, player_id: str, message: dict):
+    """Apply a validated websocket message from a player"""
+    if drain.handed_off:
+        # The match now changes only in the process it was handed to
+        return
+
+    MatchManager.touch(match_code)
+    message_type = message["type"]
+    started = time.perf_counter()
+    await MESSAGE_HANDLERS[message_type](match_code, player_id, message)
+    _handler_seconds[message_type].observe(time.perf_counter() - started)
+
+
+async def _leave(match_code: str, player_id: str):
+    await MatchManager.detach(match_code, player_id)
+
+
+ClusterManager.register(
+    {
+        "join": _join,
+        "start": _start,
+        "attach": _attach,
+        "message": _handle_message,
+        "leave": _leave,
+    }
+)
+# Read-only, and a long-poll must not hold up the match
+ClusterManager.register(
+    {
+        "state": _state,
+        "state_frame": _state_frame,
+        "lobbies": _lobbies,
+    },
+    serial=False,
+)
@@ -1,11 +1,28 @@
 from .websocket import WebSocketManager
 from .match import MatchManager
-from .state import active_connections, websocket_to_player, matches
+from .eviction import EvictionManager, eviction_stats
+from .cluster import ClusterManager
+from .heartbeat import HeartbeatManager
+from .state import (
+    active_connections,
+    websocket_to_player,
+    player_connections,
+    spectator_feeds,
+    matches,
+    evicted_matches,
+)
 
 __all__ = [
     "WebSocketManager",
     "MatchManager",
+    "EvictionManager",
+    "eviction_stats",
+    "ClusterManager",
+    "HeartbeatManager",
     "active_connections",
     "websocket_to_player",
+    "player_connections",
+    "spectator_feeds",
     "matches",
+    "evicted_matches",
 ]
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from collections import deque
+from collections.abc import Awaitable, Callable
+
+from .settings import ACTOR_BATCH_SIZE
+from .websocket import WebSocketManager
+
+logger = logging.getLogger(__name__)
+
+Command = Callable[[], Awaitable[object]]
+
+# Actors with queued commands. An actor is dropped as soon as its mailbox is empty
+_actors: dict[str, "MatchActor"] = {}
+
+
+class MatchActor:
+    """Applies the commands of one match one at a time, in arrival order
+
+    Every change to a match goes through its mailbox, so a command never
+    observes another one half applied, whatever it awaits. Commands are
+    drained in batches of up to ACTOR_BATCH_SIZE, after which the pending
+    match state broadcast goes out once for the whole batch.
+    """
+
+    __slots__ = ("match_code", "_mailbox", "_task")
+
+    def __init__(self, match_code: str):
+        self.match_code = match_code
+        self._mailbox: deque[tuple[Command, asyncio.Future | None]] = deque()
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    async def run(match_code: str, command: Command):
+        """Queue a command for a match and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        MatchActor._enqueue(match_code, command, future)
+        return await future
+
+    @staticmethod
+    def post(match_code: str, command: Command):
+        """Queue a command for a match without waiting for it"""
+        MatchActor._enqueue(match_code, command, None)
+
+    @staticmethod
+    def _enqueue(match_code: str, command: Command, future: asyncio.Future | None):
+        actor = _actors.get(match_code)
+        if actor is None:
+            actor = _actors[match_code] = MatchActor(match_code)
+        actor._mailbox.append((command, future))
+        if actor._task is None:
+            actor._task = asyncio.create_task(actor._drain())
+
+    async def _drain(self):
+        try:
+            while self._mailbox:
+                for _ in range(min(ACTOR_BATCH_SIZE, len(self._mailbox))):
+                    command, future = self._mailbox.popleft()
+                    await self._apply(command, future)
+
+                WebSocketManager.flush_match_state(self.match_code)
+                if self._mailbox:
+                    # Let other matches run between batches
+                    await asyncio.sleep(0)
+        finally:
+            del _actors[self.match_code]
+            # Only left over if the drain was cancelled, e.g. on shutdown
+            for _, future in self._mailbox:
+                if future is not None:
+                    future.cancel()
+
+    async def _apply(self, command: Command, future: asyncio.Future | None):
+        try:
+            result = await command()
+        except Exception as error:
+            if future is None:
+                logger.exception("Command for match %s failed", self.match_code)
+            elif not future.done():
+                future.set_exception(error)
+        else:
+            if future is not None and not future.done():
+                future.set_result(result)
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import logging
+from collections.abc import Callable
+from urllib.parse import urlsplit
+
+from .codec import encode
+from .settings import BUS_URL, CODE_SEED, WORKER_ID
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], None]
+
+# Longest message line accepted by the hub and the workers
+MAX_LINE_BYTES = 2**24
+
+
+class LocalBus:
+    """Bus of a single worker, where every match is local and nothing is sent"""
+
+    clustered = False
+
+    async def start(self, handler: Handler):
+        pass
+
+    async def close(self):
+        pass
+
+    def publish(self, channel: str, message: dict):
+        pass
+
+    def send(self, worker_id: int, message: dict):
+        pass
+
+    def subscribe(self, channel: str):
+        pass
+
+    def unsubscribe(self, channel: str):
+        pass
+
+
+class TcpBus:
+    """Bus relayed by a BusHub over TCP, one JSON message per line
+
+    Messages are either sent to one worker or published on a channel (a
+    match code) and received by the other workers subscribed to it.
+    """
+
+    clustered = True
+
+    def __init__(self, host: str, port: int, worker_id: int):
+        self._host = host
+        self._port = port
+        self._worker_id = worker_id
+        self._channels: set[str] = set()
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+
+    async def start(self, handler: Handler):
+        reader, self._writer = await asyncio.open_connection(
+            self._host, self._port, limit=MAX_LINE_BYTES
+        )
+        self._write({"type": "hello", "worker": self._worker_id})
+        for channel in self._channels:
+            self._write({"type": "subscribe", "channel": channel})
+        self._reader_task = asyncio.create_task(self._read_loop(reader, handler))
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def publish(self, channel: str, message: dict):
+        message["channel"] = channel
+        self._write(message)
+
+    def send(self, worker_id: int, message: dict):
+        message["to"] = worker_id
+        self._write(message)
+
+    def subscribe(self, channel: str):
+        self._channels.add(channel)
+        self._write({"type": "subscribe", "channel": channel})
+
+    def unsubscribe(self, channel: str):
+        self._channels.discard(channel)
+        self._write({"type": "unsubscribe", "channel": channel})
+
+    def _write(self, message: dict):
+        if self._writer is not None:
+            self._writer.write(encode(message) + b"\n")
+
+    async def _read_loop(self, reader: asyncio.StreamReader, handler: Handler):
+        while line := await reader.readline():
+            try:
+                handler(json.loads(line))
+            except Exception:
+                logger.exception("Failed to handle bus message")
+        logger.error("Lost the connection to the bus hub")
+
+
+class BusHub:
+    """Relays messages between the TcpBus of every worker"""
+
+    def __init__(self):
+        self._workers: dict[int, asyncio.StreamWriter] = {}
+        self._subscribers: dict[str, set[int]] = {}
+        self._subscriptions: dict[int, set[str]] = {}
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 0, sock=None):
+        if sock is not None:
+            server = await asyncio.start_server(
+                self._handle, sock=sock, limit=MAX_LINE_BYTES
+            )
+        else:
+            server = await asyncio.start_server(
+                self._handle, host, port, limit=MAX_LINE_BYTES
+            )
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker_id = None
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                kind = message.get("type")
+
+                if kind == "hello":
+                    worker_id = message["worker"]
+                    self._workers[worker_id] = writer
+                    self._subscriptions.setdefault(worker_id, set())
+                elif kind == "subscribe":
+                    self._subscribe(worker_id, message["channel"])
+                elif kind == "unsubscribe":
+                    self._unsubscribe(worker_id, message["channel"])
+                elif "to" in message:
+                    target = self._workers.get(message["to"])
+                    if target is not None:
+                        target.write(line)
+                    elif kind == "call":
+                        error = f"Worker {message['to']} is not connected"
+                        reply = {"type": "reply", "id": message["id"], "error": error}
+                        writer.write(encode(reply) + b"\n")
+                elif "channel" in message:
+                    for subscriber in self._subscribers.get(message["channel"], ()):
+                        if subscriber != worker_id:
+                            self._workers[subscriber].write(line)
+        except (ConnectionError, ValueError):
+            logger.exception("Dropping bus connection of worker %s", worker_id)
+        finally:
+            if self._workers.get(worker_id) is writer:
+                del self._workers[worker_id]
+                for channel in list(self._subscriptions.pop(worker_id, ())):
+                    self._unsubscribe(worker_id, channel)
+            writer.close()
+
+    def _subscribe(self, worker_id: int, channel: str):
+        self._subscribers.setdefault(channel, set()).add(worker_id)
+        self._subscriptions.setdefault(worker_id, set()).add(channel)
+
+    def _unsubscribe(self, worker_id: int, channel: str):
+        subscribers = self._subscribers.get(channel)
+        if subscribers is not None:
+            subscribers.discard(worker_id)
+            if not subscribers:
+                del self._subscribers[channel]
+        self._subscriptions.get(worker_id, set()).discard(channel)
+
+
+def _create_bus() -> LocalBus | TcpBus:
+    if not BUS_URL:
+        return LocalBus()
+
+    url = urlsplit(BUS_URL)
+    if url.scheme != "tcp" or not url.hostname or not url.port:
+        raise ValueError(f"Unsupported BUS_URL {BUS_URL!r}, expected tcp://host:port")
+    if not CODE_SEED:
+        # Each worker would key its own code permutation and misroute matches
+        raise ValueError("BUS_URL requires CODE_SEED, the same on every worker")
+    return TcpBus(url.hostname, url.port, WORKER_ID)
+
+
+bus = _create_bus()
@@ -0,0 +1,167 @@
+import asyncio
+import itertools
+import logging
+from collections.abc import Awaitable, Callable
+from functools import partial
+
+from .actor import MatchActor
+from .bus import bus
+from .ids import match_codes
+from .settings import CLUSTER_CALL_TIMEOUT, WORKER_COUNT, WORKER_ID
+from .websocket import WebSocketManager
+
+logger = logging.getLogger(__name__)
+
+Operation = Callable[..., Awaitable[object]]
+
+_operations: dict[str, Operation] = {}
+# Operations that change a match, run through its actor
+_serial: set[str] = set()
+# Replies awaited from other workers, by call id
+_calls: dict[int, asyncio.Future] = {}
+_call_ids = itertools.count()
+# Keeps calls served for other workers referenced until they finish
+_serving: set[asyncio.Task] = set()
+
+
+class ClusterManager:
+    """Runs every command on a match on the worker that owns it
+
+    A match lives on the worker that allocated its code, so its state is
+    only ever touched there. Operations are registered by name, and calling
+    one for a match owned by another worker sends it over the bus. Arguments
+    and results of operations must therefore be JSON serializable.
+
+    Serial operations are applied by the actor of the match, one at a time.
+    Others, such as reads that may wait a long time, run right away. Only
+    those can be gathered from every worker, since they concern no match.
+    """
+
+    @staticmethod
+    def register(operations: dict[str, Operation], serial: bool = True):
+        """Make operations callable by name"""
+        _operations.update(operations)
+        if serial:
+            _serial.update(operations)
+
+    @staticmethod
+    def owner_of(match_code: str) -> int:
+        """Worker owning a match. Malformed codes are looked up locally"""
+        if not bus.clustered or not match_codes.is_well_formed(match_code):
+            return WORKER_ID
+        return match_codes.owner_of(match_code)
+
+    @staticmethod
+    async def call(
+        match_code: str,
+        operation: str,
+        *args,
+        timeout: float = CLUSTER_CALL_TIMEOUT,
+    ):
+        """Run an operation on the worker owning a match and return its result"""
+        owner = ClusterManager.owner_of(match_code)
+        return await ClusterManager._call_worker(
+            owner, match_code, operation, args, timeout
+        )
+
+    @staticmethod
+    async def gather(
+        operation: str, *args, timeout: float = CLUSTER_CALL_TIMEOUT
+    ) -> list:
+        """Run a non-serial operation on every worker
+
+        Returns the results in worker order. Workers that fail or do not
+        answer in time are left out, so one lost worker does not fail the
+        whole request.
+        """
+        workers = range(WORKER_COUNT) if bus.clustered else [WORKER_ID]
+        results = await asyncio.gather(
+            *(
+                ClusterManager._call_worker(worker_id, "", operation, args, timeout)
+                for worker_id in workers
+            ),
+            return_exceptions=True,
+        )
+
+        answered = []
+        for worker_id, result in zip(workers, results):
+            if isinstance(result, Exception):
+                logger.warning(
+                    "Worker %d did not answer %s: %r", worker_id, operation, result
+                )
+            else:
+                answered.append(result)
+        return answered
+
+    @staticmethod
+    async def _call_worker(
+        worker_id: int, match_code: str, operation: str, args, timeout: float
+    ):
+        if worker_id == WORKER_ID:
+            return await ClusterManager._run_local(match_code, operation, args)
+
+        call_id = next(_call_ids)
+        reply = _calls[call_id] = asyncio.get_running_loop().create_future()
+        request = {
+            "type": "call",
+            "id": call_id,
+            "from": WORKER_ID,
+            "match": match_code,
+            "op": operation,
+            "args": args,
+        }
+        try:
+            bus.send(worker_id, request)
+            async with asyncio.timeout(timeout):
+                result = await reply
+        finally:
+            _calls.pop(call_id, None)
+
+        if "error" in result:
+            raise RuntimeError(
+                f"{operation} failed on worker {worker_id}: {result['error']}"
+            )
+        return result["result"]
+
+    @staticmethod
+    async def start():
+        """Connect to the other workers"""
+        await bus.start(ClusterManager._on_message)
+
+    @staticmethod
+    async def stop():
+        await bus.close()
+
+    @staticmethod
+    def _on_message(message: dict):
+        kind = message["type"]
+        if kind == "call":
+            task = asyncio.create_task(ClusterManager._serve_call(message))
+            _serving.add(task)
+            task.add_done_callback(_serving.discard)
+        elif kind == "reply":
+            reply = _calls.get(message["id"])
+            if reply is not None and not reply.done():
+                reply.set_result(message)
+        else:
+            WebSocketManager.deliver(message)
+
+    @staticmethod
+    async def _serve_call(message: dict):
+        """Run an operation called by another worker and send back the result"""
+        reply = {"type": "reply", "id": message["id"]}
+        try:
+            reply["result"] = await ClusterManager._run_local(
+                message["match"], message["op"], message["args"]
+            )
+        except Exception as error:
+            logger.exception("Operation %s failed", message["op"])
+            reply["error"] = str(error) or type(error).__name__
+        bus.send(message["from"], reply)
+
+    @staticmethod
+    async def _run_local(match_code: str, operation: str, args):
+        handler = _operations[operation]
+        if operation in _serial:
+            return await MatchActor.run(match_code, partial(handler, *args))
+        return await handler(*args)
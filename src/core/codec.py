@@ -0,0 +1,46 @@
+import json
+import logging
+from collections.abc import Callable
+
+from .settings import JSON_CODEC
+
+logger = logging.getLogger(__name__)
+
+Encoder = Callable[[object], bytes]
+
+
+def _encode_json(obj: object) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _load_encoder(name: str) -> Encoder:
+    """Resolve a codec name to an encoder, falling back to the standard library"""
+    if name == "orjson":
+        try:
+            import orjson
+
+            return orjson.dumps
+        except ImportError:
+            logger.warning("orjson is not installed, using the json module")
+    elif name != "json":
+        logger.warning("Unknown JSON_CODEC %r, using the json module", name)
+    return _encode_json
+
+
+_encoder: Encoder = _load_encoder(JSON_CODEC)
+
+
+def set_encoder(encoder: Encoder):
+    """Replace the encoder used for every outgoing message"""
+    global _encoder
+    _encoder = encoder
+
+
+def encode(obj: object) -> bytes:
+    """Encode a message as UTF-8 JSON"""
+    return _encoder(obj)
+
+
+def encode_text(obj: object) -> str:
+    """Encode a message as a JSON string, for websocket text frames"""
+    return _encoder(obj).decode()
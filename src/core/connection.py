@@ -0,0 +1,132 @@
+import asyncio
+import time
+from typing import Callable
+from fastapi import WebSocket
+
+from .codec import encode_text
+from .metrics import INBOUND_REJECTED, SEND_FAILURES, SENDS_DROPPED
+from .ratelimit import TokenBucket
+from .settings import (
+    INBOUND_ABUSE_POLICY,
+    INBOUND_BURST,
+    INBOUND_RATE,
+    SEND_QUEUE_SIZE,
+    SEND_TIMEOUT,
+    SLOW_CONSUMER_POLICY,
+)
+
+# Close code for clients disconnected by INBOUND_ABUSE_POLICY
+POLICY_VIOLATION_CLOSE_CODE = 1008
+
+# Keeps socket-closing tasks referenced until they finish
+_closing_tasks: set[asyncio.Task] = set()
+
+
+class Connection:
+    """A player's websocket with its own bounded outbound queue and writer task"""
+
+    __slots__ = (
+        "websocket",
+        "match_code",
+        "player_id",
+        "delta",
+        "lagging",
+        "closed",
+        "inbound",
+        "warned",
+        "last_seen",
+        "_queue",
+        "_writer",
+        "_on_close",
+    )
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        match_code: str,
+        player_id: str,
+        on_close: Callable[["Connection"], None],
+        delta: bool = False,
+    ):
+        self.websocket = websocket
+        self.match_code = match_code
+        self.player_id = player_id
+        # Receives match_state_patch deltas instead of full match_state_update
+        self.delta = delta
+        self.lagging = False
+        self.closed = False
+        self.inbound = TokenBucket(INBOUND_RATE, INBOUND_BURST)
+        # Set once the client was warned, until a message of theirs is accepted
+        self.warned = False
+        # When the client last sent anything, for heartbeat timeouts
+        self.last_seen = time.monotonic()
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self._on_close = on_close
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, text: str) -> bool:
+        """Queue a frame without waiting for it to be sent. Returns False if dropped"""
+        if self.closed:
+            return False
+
+        try:
+            self._queue.put_nowait(text)
+        except asyncio.QueueFull:
+            SENDS_DROPPED.inc()
+            self.lagging = True
+            if SLOW_CONSUMER_POLICY == "disconnect":
+                self.close()
+            return False
+
+        return True
+
+    def reject(self, reason: str):
+        """Handle an inbound message that was refused, per INBOUND_ABUSE_POLICY"""
+        INBOUND_REJECTED.labels(reason).inc()
+        if INBOUND_ABUSE_POLICY == "disconnect":
+            self.close(POLICY_VIOLATION_CLOSE_CODE, reason)
+        elif INBOUND_ABUSE_POLICY == "warn" and not self.warned:
+            self.warned = True
+            self.send(encode_text({"type": "error", "error": reason}))
+
+    @property
+    def queue_depth(self) -> int:
+        """Frames waiting to be written"""
+        return self._queue.qsize()
+
+    def close(self, code: int = 1000, reason: str | None = None):
+        """Stop the writer and unregister the connection"""
+        if self.closed:
+            return
+
+        self.closed = True
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+            task = asyncio.create_task(self._close_websocket(code, reason))
+            _closing_tasks.add(task)
+            task.add_done_callback(_closing_tasks.discard)
+        self._on_close(self)
+
+    async def _close_websocket(self, code: int = 1000, reason: str | None = None):
+        """Close the socket so the receive loop notices, if it has not already"""
+        try:
+            async with asyncio.timeout(SEND_TIMEOUT):
+                await self.websocket.close(code, reason)
+        except Exception:
+            pass
+
+    async def _write_loop(self):
+        """Write queued frames in order, each bounded by the send deadline"""
+        try:
+            while True:
+                text = await self._queue.get()
+                async with asyncio.timeout(SEND_TIMEOUT):
+                    await self.websocket.send_text(text)
+                if self.lagging and self._queue.empty():
+                    self.lagging = False
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            SEND_FAILURES.inc()
+            self.close()
+            await self._close_websocket()
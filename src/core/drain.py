@@ -0,0 +1,137 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import signal
+import threading
+
+from ..models import Match
+from ..models.match import reserve_version, restore_versions
+from .events import event_log
+from .journal import journal
+from .scheduler import scheduler
+from .settings import HANDOFF_FILE
+from .state import matches
+
+logger = logging.getLogger(__name__)
+
+# Version of the export format, checked on import
+HANDOFF_FORMAT = 1
+
+
+class Drain:
+    """Takes a worker out of service without losing its matches
+
+    While draining, no match is created and closing sockets no longer
+    removes players, so shutting down does not set off a broadcast per
+    departure. Exporting then hands every match off: its state is
+    serialized for a replacement process to import, and this process stops
+    changing it. Players reattach to the replacement with their session
+    tokens.
+    """
+
+    def __init__(self):
+        self.draining = False
+        self.handed_off = False
+        # Why draining started, once it has been announced
+        self.reason: str | None = None
+
+    def start(self, reason: str):
+        """Stop taking new matches and keep players through disconnects"""
+        if self.reason is not None:
+            return
+
+        self.draining = True
+        self.reason = reason
+        logger.info("Draining (%s) with %d matches", reason, len(matches))
+        event_log.emit("drain_started", reason=reason, matches=len(matches))
+
+    def export(self) -> bytes:
+        """Serialize every match and stop applying changes to them"""
+        self.start("export")
+        self.handed_off = True
+        for match_code in matches:
+            scheduler.cancel_match(match_code)
+
+        state = {
+            "format": HANDOFF_FORMAT,
+            "version": reserve_version(),
+            "matches": [match.to_dict() for match in matches.values()],
+        }
+        event_log.emit("matches_exported", matches=len(matches))
+        return gzip.compress(json.dumps(state, separators=(",", ":")).encode())
+
+    def import_state(self, data: bytes) -> tuple[list[str], list[str]]:
+        """Load exported matches. Returns the codes imported and the codes skipped
+
+        Matches whose code is already in use here are skipped.
+        """
+        state = json.loads(gzip.decompress(data))
+        if state.get("format") != HANDOFF_FORMAT:
+            raise ValueError(f"Unsupported handoff format {state.get('format')!r}")
+
+        imported, skipped = [], []
+        for match_data in state["matches"]:
+            if match_data["code"] in matches:
+                skipped.append(match_data["code"])
+                continue
+
+            match = Match.from_dict(match_data)
+            matches[match.code] = match
+            imported.append(match.code)
+
+        # Never reuse a version the exporting process handed out
+        restore_versions(max(reserve_version(), state["version"]) + 1)
+        if imported:
+            journal.snapshot()
+        event_log.emit("matches_imported", matches=len(imported), skipped=len(skipped))
+        return imported, skipped
+
+    def shutdown(self):
+        """Drain on a shutdown signal, exporting to HANDOFF_FILE if it is set"""
+        self.start("signal")
+        if not HANDOFF_FILE or self.handed_off:
+            return
+
+        temporary_path = HANDOFF_FILE + ".tmp"
+        with open(temporary_path, "wb") as handoff_file:
+            handoff_file.write(self.export())
+            handoff_file.flush()
+            os.fsync(handoff_file.fileno())
+        os.replace(temporary_path, HANDOFF_FILE)
+        logger.info("Exported %d matches to %s", len(matches), HANDOFF_FILE)
+
+    def import_file(self) -> list[str]:
+        """Import the matches left in HANDOFF_FILE by a previous process, once"""
+        if not HANDOFF_FILE or not os.path.exists(HANDOFF_FILE):
+            return []
+
+        with open(HANDOFF_FILE, "rb") as handoff_file:
+            imported, _ = self.import_state(handoff_file.read())
+        # Keep the file for inspection, but never import it twice
+        os.replace(HANDOFF_FILE, HANDOFF_FILE + ".imported")
+        logger.info("Imported %d matches from %s", len(imported), HANDOFF_FILE)
+        return imported
+
+    def install_signal_handlers(self):
+        """Drain before the server reacts to SIGTERM or SIGINT by closing sockets"""
+        # Signals can only be handled in the main thread, e.g. not under a test client
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            previous = signal.getsignal(signum)
+
+            def handler(received, frame, previous=previous):
+                # Set right away, so sockets closed from here on keep their players
+                self.draining = True
+                loop.call_soon_threadsafe(self.shutdown)
+                if callable(previous):
+                    previous(received, frame)
+
+            signal.signal(signum, handler)
+
+
+drain = Drain()
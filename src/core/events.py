@@ -0,0 +1,121 @@
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from typing import BinaryIO
+
+from .metrics import Metric
+from .settings import EVENT_LOG, EVENT_QUEUE_SIZE, EVENT_SAMPLE_RATES, WORKER_ID
+
+logger = logging.getLogger(__name__)
+
+EVENTS_DROPPED = Metric(
+    "impostor_events_dropped_total",
+    "Events dropped because the event log queue was full",
+).labels()
+
+# Most events written by the writer thread in one go
+WRITE_BATCH = 256
+
+
+class EventLog:
+    """Structured events written as JSON lines by a background thread
+
+    emit() only samples and enqueues, so it never blocks the event loop:
+    when the queue is full the event is dropped and counted instead.
+    """
+
+    def __init__(
+        self,
+        stream: BinaryIO | None,
+        capacity: int = 10000,
+        sample_rates: dict[str, float] | None = None,
+    ):
+        self._stream = stream
+        self._sample_rates = sample_rates or {}
+        self._queue: queue.Queue[dict | None] = queue.Queue(maxsize=capacity)
+        self._thread: threading.Thread | None = None
+        if stream is not None:
+            self._thread = threading.Thread(
+                target=self._write_loop, name="event-log", daemon=True
+            )
+            self._thread.start()
+
+    def emit(self, event: str, **fields):
+        """Record an event, e.g. emit("player_joined", match=code, player=id)"""
+        if self._thread is None:
+            return
+
+        rate = self._sample_rates.get(event)
+        if rate is not None and random.random() >= rate:
+            return
+
+        record = {"ts": round(time.time(), 3), "event": event, "worker": WORKER_ID}
+        record.update(fields)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            EVENTS_DROPPED.inc()
+
+    def close(self, timeout: float = 5.0):
+        """Write the events still queued and stop the writer thread"""
+        if self._thread is None:
+            return
+
+        thread, self._thread = self._thread, None
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def _write_loop(self):
+        while True:
+            records = [self._queue.get()]
+            while records[-1] is not None and len(records) < WRITE_BATCH:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = [_encode(record) for record in records if record is not None]
+            try:
+                self._stream.write(b"".join(lines))
+                self._stream.flush()
+            except Exception:
+                logger.exception("Failed to write events")
+
+            if records[-1] is None:
+                return
+
+
+def _encode(record: dict) -> bytes:
+    return json.dumps(record, separators=(",", ":"), default=str).encode() + b"\n"
+
+
+def _open_stream(target: str) -> BinaryIO | None:
+    if not target:
+        return None
+    if target == "stdout":
+        return sys.stdout.buffer
+    if target == "stderr":
+        return sys.stderr.buffer
+    return open(target, "ab")
+
+
+def _parse_sample_rates(spec: str) -> dict[str, float]:
+    """Parse "vote_cast=0.1,connected=0.5" into rates by event name"""
+    rates = {}
+    for item in spec.split(","):
+        if item.strip():
+            event, _, rate = item.partition("=")
+            rates[event.strip()] = float(rate)
+    return rates
+
+
+event_log = EventLog(
+    _open_stream(EVENT_LOG), EVENT_QUEUE_SIZE, _parse_sample_rates(EVENT_SAMPLE_RATES)
+)
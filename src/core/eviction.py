@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import time
+
+from .events import event_log
+from .ids import match_codes
+from .journal import journal
+from .lobbies import lobby_index
+from .scheduler import scheduler
+from .settings import (
+    EVICTED_MATCH_MEMORY,
+    MATCH_TTL_EMPTY,
+    MATCH_TTL_GAME_OVER,
+    MATCH_TTL_IN_GAME,
+    MATCH_TTL_LOBBY,
+    MAX_MATCHES,
+    REAPER_INTERVAL,
+)
+from .state import active_connections, evicted_matches, matches
+from .websocket import WebSocketManager
+
+logger = logging.getLogger(__name__)
+
+# Close code sent to sockets of an evicted match
+MATCH_EXPIRED_CLOSE_CODE = 4410
+
+eviction_stats = {
+    "evictions_idle": 0,
+    "evictions_capacity": 0,
+    "reclaimed_players": 0,
+    "reclaimed_connections": 0,
+}
+
+
+class EvictionManager:
+    @staticmethod
+    def is_evicted(match_code: str) -> bool:
+        """Check if a match code belonged to a match that was evicted"""
+        return match_code in evicted_matches
+
+    @staticmethod
+    def _ttl(match) -> float:
+        """Idle time after which a match is evicted, based on its phase"""
+        if not match.players:
+            return MATCH_TTL_EMPTY
+        if match.phase == "lobby":
+            return MATCH_TTL_LOBBY
+        if match.phase == "game_over":
+            return MATCH_TTL_GAME_OVER
+        return MATCH_TTL_IN_GAME
+
+    @staticmethod
+    def evict_match(match_code: str, reason: str = "idle"):
+        """Drop a match, its timers and its connections"""
+        match = matches.pop(match_code, None)
+        if match is None:
+            return
+
+        scheduler.cancel_match(match_code)
+        match_codes.release(match_code)
+        journal.record(match_code, "drop")
+        lobby_index.discard(match_code)
+
+        evicted_matches[match_code] = None
+        while len(evicted_matches) > EVICTED_MATCH_MEMORY:
+            evicted_matches.popitem(last=False)
+
+        connections = active_connections.get(match_code, [])
+        event_log.emit("match_evicted", match=match_code, reason=reason)
+        eviction_stats[f"evictions_{reason}"] += 1
+        eviction_stats["reclaimed_players"] += len(match.players)
+        eviction_stats["reclaimed_connections"] += len(connections)
+
+        WebSocketManager.close_match(
+            match_code, MATCH_EXPIRED_CLOSE_CODE, "Match expired"
+        )
+        WebSocketManager.wake_state_waiters(match_code)
+
+    @staticmethod
+    def forget_eviction(match_code: str):
+        """Stop reporting a code as expired, e.g. once it is reused"""
+        evicted_matches.pop(match_code, None)
+
+    @staticmethod
+    def enforce_capacity():
+        """Evict the least recently active matches to make room for a new one"""
+        if MAX_MATCHES <= 0:
+            return
+
+        while len(matches) >= MAX_MATCHES:
+            EvictionManager.evict_match(next(iter(matches)), "capacity")
+
+    @staticmethod
+    def reap() -> int:
+        """Evict every match idle for longer than its TTL. Returns how many"""
+        now = time.monotonic()
+        shortest_ttl = min(
+            MATCH_TTL_EMPTY, MATCH_TTL_LOBBY, MATCH_TTL_IN_GAME, MATCH_TTL_GAME_OVER
+        )
+
+        expired = []
+        # Least recently active first, so stop once no match can be expired
+        for match_code, match in matches.items():
+            idle = now - match.last_active
+            if idle < shortest_ttl:
+                break
+            if idle >= EvictionManager._ttl(match):
+                expired.append(match_code)
+
+        for match_code in expired:
+            EvictionManager.evict_match(match_code)
+        return len(expired)
+
+    @staticmethod
+    async def run_reaper():
+        """Periodically evict idle matches"""
+        while True:
+            await asyncio.sleep(REAPER_INTERVAL)
+            try:
+                EvictionManager.reap()
+            except Exception:
+                logger.exception("Match reaper failed")
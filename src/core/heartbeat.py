@@ -0,0 +1,45 @@
+import asyncio
+import logging
+import time
+
+from .codec import encode_text
+from .settings import HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT
+from .state import websocket_to_player
+
+logger = logging.getLogger(__name__)
+
+# Close code sent to sockets that stopped answering heartbeats
+HEARTBEAT_TIMEOUT_CLOSE_CODE = 4408
+
+PING_FRAME = encode_text({"type": "ping"})
+
+
+class HeartbeatManager:
+    @staticmethod
+    def sweep() -> int:
+        """Ping every socket and close the silent ones. Returns how many were closed
+
+        With HEARTBEAT_TIMEOUT at 0 sockets are only pinged, never closed.
+        """
+        now = time.monotonic()
+        closed = 0
+        for connection in list(websocket_to_player.values()):
+            if HEARTBEAT_TIMEOUT > 0 and now - connection.last_seen > HEARTBEAT_TIMEOUT:
+                connection.close(HEARTBEAT_TIMEOUT_CLOSE_CODE, "Heartbeat timeout")
+                closed += 1
+            else:
+                connection.send(PING_FRAME)
+        return closed
+
+    @staticmethod
+    async def run_heartbeats():
+        """Periodically ping sockets, if heartbeats are enabled"""
+        if HEARTBEAT_INTERVAL <= 0:
+            return
+
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                HeartbeatManager.sweep()
+            except Exception:
+                logger.exception("Heartbeat sweep failed")
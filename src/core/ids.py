@@ -0,0 +1,154 @@
+import random
+import string
+import threading
+from collections import deque
+from collections.abc import Container
+
+from .settings import CODE_SEED, CODE_RECYCLE_QUARANTINE, WORKER_COUNT, WORKER_ID
+
+LETTERS = 4
+DIGITS = 2
+MATCH_CODE_SPACE = len(string.ascii_uppercase) ** LETTERS * 10**DIGITS
+PLAYER_ID_SPACE = 10**6
+
+
+class Permutation:
+    """Keyed bijection of range(size) that scrambles sequential numbers
+
+    A small Feistel network over the next even power of two, cycle-walked
+    back into range. The power of two is less than 4x size, so a walk takes
+    under 4 steps on average however many values have been used.
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, size: int, rng: random.Random):
+        self.size = size
+        bits = max(2, (size - 1).bit_length())
+        self._half_bits = (bits + 1) // 2
+        self._mask = (1 << self._half_bits) - 1
+        self._keys = [rng.getrandbits(32) for _ in range(self.ROUNDS)]
+
+    def apply(self, value: int) -> int:
+        value = self._encrypt(value)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def invert(self, value: int) -> int:
+        value = self._decrypt(value)
+        while value >= self.size:
+            value = self._decrypt(value)
+        return value
+
+    def _round(self, half: int, key: int) -> int:
+        mixed = ((half ^ key) * 0x9E3779B1) & 0xFFFFFFFF
+        return mixed >> (32 - self._half_bits)
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self._half_bits, value & self._mask
+        for key in self._keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self._half_bits) | right
+
+    def _decrypt(self, value: int) -> int:
+        left, right = value >> self._half_bits, value & self._mask
+        for key in reversed(self._keys):
+            left, right = right ^ self._round(left, key), left
+        return (left << self._half_bits) | right
+
+
+class MatchCodeAllocator:
+    """Hands out match codes that are unique among live matches, in constant time
+
+    Sequence numbers are striped across workers and scrambled by a shared
+    permutation, so workers never hand out the same code and the owner of a
+    code can be recovered from the code itself. Released codes are reused
+    once enough of them have piled up, or once fresh codes run out.
+    """
+
+    def __init__(
+        self,
+        seed: int | None = None,
+        worker_id: int = 0,
+        worker_count: int = 1,
+        quarantine: int = 0,
+    ):
+        self._permutation = Permutation(MATCH_CODE_SPACE, random.Random(seed))
+        self._worker_count = worker_count
+        self._next_sequence = worker_id
+        self._quarantine = quarantine
+        self._released: deque[str] = deque()
+        self._lock = threading.Lock()
+
+    def allocate(self, in_use: Container[str]) -> str:
+        """Return a code not present in in_use"""
+        with self._lock:
+            while len(self._released) > self._quarantine:
+                code = self._released.popleft()
+                if code not in in_use:
+                    return code
+
+            # Only codes restored from before a restart can already be in use
+            while self._next_sequence < MATCH_CODE_SPACE:
+                sequence = self._next_sequence
+                self._next_sequence += self._worker_count
+                code = self._format(self._permutation.apply(sequence))
+                if code not in in_use:
+                    return code
+
+            while self._released:
+                code = self._released.popleft()
+                if code not in in_use:
+                    return code
+
+        raise RuntimeError("Match code space exhausted")
+
+    def release(self, code: str):
+        """Make the code of a match that no longer exists available again"""
+        with self._lock:
+            self._released.append(code)
+
+    def owner_of(self, code: str) -> int:
+        """Worker that allocated a code. The code must be well formed"""
+        sequence = self._permutation.invert(self._parse(code))
+        return sequence % self._worker_count
+
+    @staticmethod
+    def is_well_formed(code: str) -> bool:
+        """Check that a code has the shape of an allocated code"""
+        return (
+            len(code) == LETTERS + DIGITS
+            and all(letter in string.ascii_uppercase for letter in code[:LETTERS])
+            and all(digit in string.digits for digit in code[LETTERS:])
+        )
+
+    @staticmethod
+    def _format(index: int) -> str:
+        letter_index, number = divmod(index, 10**DIGITS)
+        letters = []
+        for _ in range(LETTERS):
+            letter_index, letter = divmod(letter_index, len(string.ascii_uppercase))
+            letters.append(string.ascii_uppercase[letter])
+        return "".join(reversed(letters)) + f"{number:0{DIGITS}d}"
+
+    @staticmethod
+    def _parse(code: str) -> int:
+        letter_index = 0
+        for letter in code[:LETTERS]:
+            letter_index = letter_index * len(string.ascii_uppercase) + (
+                ord(letter) - ord("A")
+            )
+        return letter_index * 10**DIGITS + int(code[LETTERS:])
+
+
+_rng = random.Random(CODE_SEED or None)
+match_codes = MatchCodeAllocator(
+    _rng.getrandbits(64), WORKER_ID, WORKER_COUNT, CODE_RECYCLE_QUARANTINE
+)
+player_ids = Permutation(PLAYER_ID_SPACE, _rng)
+
+
+def player_id_for(sequence: int) -> str:
+    """Player id for the n-th player to join a match, unique within that match"""
+    return f"p{player_ids.apply(sequence % PLAYER_ID_SPACE)}"
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from ..models import Match
+from ..models.match import reserve_version, restore_versions, set_recorder
+from .settings import (
+    JOURNAL_COMMIT_INTERVAL,
+    JOURNAL_DIR,
+    JOURNAL_SNAPSHOT_INTERVAL,
+    WORKER_ID,
+)
+from .state import matches
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """Append-only log of match mutations, compacted into periodic snapshots
+
+    Every journaled Match mutator, plus match creation and removal, becomes
+    one numbered record. A background thread writes records in groups and
+    fsyncs once per JOURNAL_COMMIT_INTERVAL. Each snapshot holds every match
+    and the number of the last record it includes, so once the snapshot is
+    in place the journal is truncated. Recovery loads the latest snapshot
+    and replays only the records after it.
+    """
+
+    def __init__(self, directory: str, worker_id: int):
+        self.enabled = bool(directory)
+        self._journal_path = os.path.join(directory, f"journal-{worker_id}.log")
+        self._snapshot_path = os.path.join(directory, f"snapshot-{worker_id}.json")
+        self._directory = directory
+        self._sequence = 0
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+
+    def restore(self) -> list[str]:
+        """Load the matches saved by a previous run. Returns their codes"""
+        if not self.enabled:
+            return []
+
+        started = time.monotonic()
+        snapshot = {"sequence": 0, "version": 1, "matches": []}
+        if os.path.exists(self._snapshot_path):
+            with open(self._snapshot_path, "rb") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+
+        for data in snapshot["matches"]:
+            match = Match.from_dict(data)
+            matches[match.code] = match
+        self._sequence = snapshot["sequence"]
+        version = snapshot["version"]
+
+        replayed = 0
+        if os.path.exists(self._journal_path):
+            with open(self._journal_path, "rb") as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A record cut short by a crash; nothing after it was committed
+                        break
+                    if record["s"] <= self._sequence:
+                        continue
+                    self._apply(record)
+                    self._sequence = record["s"]
+                    version = max(version, record["v"])
+                    replayed += 1
+
+        # Never reuse a version a client may have seen as an ETag
+        restore_versions(version + 1)
+
+        logger.info(
+            "Restored %d matches from a snapshot and %d journal records in %.3fs",
+            len(matches),
+            replayed,
+            time.monotonic() - started,
+        )
+        return list(matches)
+
+    @staticmethod
+    def _apply(record: dict):
+        match_code, operation = record["m"], record["op"]
+        if operation == "create":
+            matches[match_code] = Match(code=match_code)
+        elif operation == "drop":
+            matches.pop(match_code, None)
+        elif match_code in matches:
+            getattr(matches[match_code], operation)(*record["a"], **record["k"])
+        if match_code in matches:
+            matches[match_code].version = record["v"]
+
+    def start(self):
+        """Record mutations from now on, starting from a fresh snapshot"""
+        if not self.enabled:
+            return
+
+        os.makedirs(self._directory, exist_ok=True)
+        self._thread = threading.Thread(
+            target=self._write_loop, name="journal", daemon=True
+        )
+        self._thread.start()
+        self.snapshot()
+        set_recorder(self.record)
+
+    def close(self, timeout: float = 5.0):
+        """Commit the records still queued and stop the writer thread"""
+        if self._thread is None:
+            return
+
+        set_recorder(None)
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def record(self, match_code: str, operation: str, args=(), kwargs=None):
+        """Queue a mutation of a match, or its creation ("create") or removal ("drop")"""
+        if self._thread is None:
+            return
+
+        match = matches.get(match_code)
+        self._sequence += 1
+        record = {"s": self._sequence, "m": match_code, "op": operation, "a": args}
+        record["k"] = kwargs or {}
+        # The version the operation left the match at, reproduced on replay
+        record["v"] = match.version if match is not None else 0
+        self._queue.put(record)
+
+    def snapshot(self):
+        """Queue a snapshot of every match, after which the journal is truncated"""
+        if self._thread is None:
+            return
+
+        self._queue.put(
+            {
+                "sequence": self._sequence,
+                "version": reserve_version(),
+                "matches": [match.to_dict() for match in matches.values()],
+            }
+        )
+
+    async def run_snapshots(self):
+        """Periodically compact the journal into a snapshot"""
+        if not self.enabled:
+            return
+
+        while True:
+            await asyncio.sleep(JOURNAL_SNAPSHOT_INTERVAL)
+            try:
+                self.snapshot()
+            except Exception:
+                logger.exception("Journal snapshot failed")
+
+    def _write_loop(self):
+        journal_file = open(self._journal_path, "ab")
+        try:
+            while True:
+                # Group every record arriving within the commit interval
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + JOURNAL_COMMIT_INTERVAL
+                while batch[-1] is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+
+                lines = []
+                for item in batch:
+                    if item is None or "matches" in item:
+                        self._commit(journal_file, lines)
+                        lines = []
+                    if item is None:
+                        return
+                    if "matches" in item:
+                        journal_file = self._write_snapshot(journal_file, item)
+                    else:
+                        lines.append(_encode(item))
+                self._commit(journal_file, lines)
+        except Exception:
+            logger.exception("Journal writer failed, matches are no longer persisted")
+        finally:
+            journal_file.close()
+
+    @staticmethod
+    def _commit(journal_file, lines: list[bytes]):
+        if lines:
+            journal_file.write(b"".join(lines))
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def _write_snapshot(self, journal_file, snapshot: dict):
+        """Atomically replace the snapshot, then start an empty journal"""
+        temporary_path = self._snapshot_path + ".tmp"
+        with open(temporary_path, "wb") as snapshot_file:
+            snapshot_file.write(_encode(snapshot))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary_path, self._snapshot_path)
+        directory = os.open(self._directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+        # Records the snapshot includes are skipped on replay, so a crash
+        # before the truncation below loses nothing
+        journal_file.close()
+        return open(self._journal_path, "wb")
+
+
+def _encode(item: dict) -> bytes:
+    return json.dumps(item, separators=(",", ":")).encode() + b"\n"
+
+
+journal = Journal(JOURNAL_DIR, WORKER_ID)
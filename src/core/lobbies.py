@@ -0,0 +1,82 @@
+from bisect import bisect_left, insort
+from itertools import islice
+
+from ..models import Match
+from .settings import MAX_PLAYERS
+
+
+class LobbyIndex:
+    """Open public lobbies of this worker, grouped by player count
+
+    A match is filed while it is public, in the lobby phase and has room
+    for another player, and refiled whenever its player count changes. The
+    distinct counts in use are kept sorted, so the fullest lobby is found
+    without scanning, and within a count lobbies keep the order they were
+    filed in.
+    """
+
+    def __init__(self):
+        self._buckets: dict[int, dict[str, None]] = {}
+        # Player counts with at least one lobby, ascending
+        self._counts: list[int] = []
+        # Player count each lobby is filed under
+        self._filed: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._filed)
+
+    def update(self, match: Match):
+        """File a match under its current player count, or unfile it if it is not open"""
+        is_open = (
+            match.public and match.phase == "lobby" and len(match.players) < MAX_PLAYERS
+        )
+        count = len(match.players) if is_open else None
+        if self._filed.get(match.code) == count:
+            return
+
+        self.discard(match.code)
+        if count is not None:
+            self._filed[match.code] = count
+            bucket = self._buckets.get(count)
+            if bucket is None:
+                bucket = self._buckets[count] = {}
+                insort(self._counts, count)
+            bucket[match.code] = None
+
+    def discard(self, match_code: str):
+        """Unfile a match, if it is filed"""
+        count = self._filed.pop(match_code, None)
+        if count is None:
+            return
+
+        bucket = self._buckets[count]
+        del bucket[match_code]
+        if not bucket:
+            del self._buckets[count]
+            del self._counts[bisect_left(self._counts, count)]
+
+    def fullest(self) -> str | None:
+        """Code of the open lobby with the most players, the oldest among equals"""
+        if not self._counts:
+            return None
+        return next(iter(self._buckets[self._counts[-1]]))
+
+    def page(self, offset: int, limit: int) -> list[str]:
+        """Codes of open lobbies, fullest first, skipping the first offset"""
+        codes: list[str] = []
+        for count in reversed(self._counts):
+            bucket = self._buckets[count]
+            if offset >= len(bucket):
+                # Skip whole buckets without walking them
+                offset -= len(bucket)
+                continue
+
+            for match_code in islice(bucket, offset, None):
+                codes.append(match_code)
+                if len(codes) == limit:
+                    return codes
+            offset = 0
+        return codes
+
+
+lobby_index = LobbyIndex()
@@ -1,91 +1,235 @@
-import random
-import string
+import heapq
+import secrets
+import time
+from functools import partial
+from itertools import islice
+
+from ..models import Match
+from .events import event_log
+from .eviction import EvictionManager
+from .ids import match_codes, player_id_for
+from .journal import journal
+from .lobbies import lobby_index
+from .scheduler import scheduler
+from .settings import MAX_PLAYERS, RECONNECT_GRACE, REQUIRE_SESSION_TOKEN
+from .snapshot import Snapshot
 from .state import matches
 from .websocket import WebSocketManager
 
 
 class MatchManager:
     @staticmethod
-    def get_match_info(match_code: str) -> dict | None:
-        """Get match information"""
-        if match_code not in matches:
+    def touch(match_code: str):
+        """Record player activity on a match, keeping it from being evicted"""
+        match = matches.get(match_code)
+        if match is None:
+            return
+
+        match.last_active = time.monotonic()
+        matches.move_to_end(match_code)
+
+    @staticmethod
+    def get_snapshot(match_code: str) -> Snapshot | None:
+        """Get the cached, encoded state of a match"""
+        match = matches.get(match_code)
+        if match is None:
             return None
 
-        players = []
-        for player_id, player_data in matches[match_code]["players"].items():
-            players.append(
-                {
-                    "id": player_id,
-                    "name": player_data["name"],
-                    "host": player_data["host"],
-                    "ready_to_vote": player_data["ready_to_vote"],
-                    "alive": player_data["alive"],
-                }
-            )
+        return Snapshot.of(match)
 
-        return {
-            "phase": matches[match_code]["phase"],
-            "can_start": matches[match_code]["can_start"],
-            "round": matches[match_code]["round"],
-            "players": players,
-        }
+    @staticmethod
+    def get_match_info(match_code: str) -> dict | None:
+        """Get match information. The returned dict is shared, do not modify it"""
+        snapshot = MatchManager.get_snapshot(match_code)
+        if snapshot is None:
+            return None
+
+        return snapshot.info
 
     @staticmethod
-    def create_match() -> str:
+    def create_match(public: bool = False) -> str:
         """Create a new match and return the match code"""
-        letters = "".join(random.choices(string.ascii_uppercase, k=4))
-        numbers = "".join(random.choices(string.digits, k=2))
-        match_code = letters + numbers
-
-        matches[match_code] = {
-            "players": {},
-            "can_start": False,
-            "phase": "lobby",
-            "round": 1,
-            "votes": {},
-            "secret_character": "Kanye West",
-            "propositions": {},
-        }
+        EvictionManager.enforce_capacity()
+        match_code = match_codes.allocate(matches)
+        EvictionManager.forget_eviction(match_code)
+        match = matches[match_code] = Match(code=match_code)
+        journal.record(match_code, "create")
+        if public:
+            match.set_public(True)
+        lobby_index.update(match)
+        event_log.emit("match_created", match=match_code, public=public)
 
         return match_code
 
     @staticmethod
     async def join_match(match_code: str, player_name: str):
         """Add a player to a match"""
-        if match_code not in matches:
+        match = matches.get(match_code)
+        if match is None:
             return None
 
-        if matches[match_code]["phase"] != "lobby":
+        if match.phase != "lobby":
             return None
 
-        player_id = f"p{random.randint(0, 10**6)}"
-        is_host = len(matches[match_code]["players"]) == 0
+        if len(match.players) >= MAX_PLAYERS:
+            return {"error": "Match is full"}
 
-        matches[match_code]["players"][player_id] = {
+        # Ids come from a per-process permutation, so a match restored from
+        # another process may already hold the next one; skip ids in use
+        player_id = player_id_for(match.take_join_sequence())
+        while player_id in match.players:
+            player_id = player_id_for(match.take_join_sequence())
+        is_host = not match.players
+        session_token = secrets.token_urlsafe(16)
+
+        match.add_player(player_id, player_name, is_host, session_token)
+        lobby_index.update(match)
+        event_log.emit("player_joined", match=match_code, player=player_id)
+
+        await WebSocketManager.broadcast_match_state(match_code)
+        return {
+            "player_id": player_id,
             "name": player_name,
-            "alive": True,
             "host": is_host,
-            "ready_to_vote": False,
-            "role": "normal",
+            "session_token": session_token,
+        }
+
+    @staticmethod
+    def attach(match_code: str, player_id: str, session_token: str | None) -> bool:
+        """Count a new socket of a player. Returns False if it must be refused
+
+        A socket presenting a session token must present the player's. A
+        player waiting out their reconnect grace period can only be resumed
+        with it, and with REQUIRE_SESSION_TOKEN every socket needs it.
+        """
+        match = matches.get(match_code)
+        player = match.players.get(player_id) if match else None
+        if player is None:
+            return True
+
+        timer_name = _reconnect_timer(player_id)
+        resuming = timer_name in scheduler.pending(match_code)
+        if session_token is None:
+            if REQUIRE_SESSION_TOKEN or resuming:
+                return False
+        # Compared as bytes, since the token comes from the query string as typed
+        elif not secrets.compare_digest(
+            session_token.encode(), player.session_token.encode()
+        ):
+            return False
+
+        if resuming:
+            scheduler.cancel(match_code, timer_name)
+            event_log.emit("player_reattached", match=match_code, player=player_id)
+
+        player.connections += 1
+        return True
+
+    @staticmethod
+    async def detach(match_code: str, player_id: str):
+        """Count a closed socket of a player, removing them once the grace period ends"""
+        match = matches.get(match_code)
+        player = match.players.get(player_id) if match else None
+        if player is None:
+            return
+
+        player.connections -= 1
+        if player.connections > 0:
+            return
+
+        if RECONNECT_GRACE > 0:
+            scheduler.schedule(
+                match_code,
+                _reconnect_timer(player_id),
+                RECONNECT_GRACE,
+                partial(MatchManager.remove_player, match_code, player_id),
+            )
+        else:
+            await MatchManager.remove_player(match_code, player_id)
+
+    @staticmethod
+    def list_lobbies(offset: int, limit: int) -> dict:
+        """A page of the open public lobbies, fullest first"""
+        lobbies = []
+        for match_code in lobby_index.page(offset, limit):
+            match = matches[match_code]
+            host = match.players.get(match.host_id)
+            lobbies.append(
+                {
+                    "match_code": match_code,
+                    "players": len(match.players),
+                    "host": host.name if host else None,
+                }
+            )
+
+        next_offset = offset + len(lobbies)
+        return {
+            "lobbies": lobbies,
+            "total": len(lobby_index),
+            "next_offset": next_offset if next_offset < len(lobby_index) else None,
+        }
+
+    @staticmethod
+    def merge_lobby_pages(pages: list[dict], offset: int, limit: int) -> dict:
+        """A page of the lobbies of every worker, from the first pages of each
+
+        Each page must start at offset 0 and hold at least offset + limit
+        lobbies if the worker has that many. Equally full lobbies keep the
+        order of the pages, so a listing pages consistently.
+        """
+        merged = heapq.merge(
+            *(page["lobbies"] for page in pages), key=lambda lobby: -lobby["players"]
+        )
+        lobbies = list(islice(merged, offset, offset + limit))
+        total = sum(page["total"] for page in pages)
+
+        next_offset = offset + len(lobbies)
+        return {
+            "lobbies": lobbies,
+            "total": total,
+            "next_offset": next_offset if next_offset < total else None,
         }
 
+    @staticmethod
+    def resume(match_code: str):
+        """Index a restored match and give its players the grace period to reattach"""
+        match = matches.get(match_code)
+        if match is None:
+            return
+
+        lobby_index.update(match)
+        for player_id in match.players:
+            if RECONNECT_GRACE > 0:
+                scheduler.schedule(
+                    match_code,
+                    _reconnect_timer(player_id),
+                    RECONNECT_GRACE,
+                    partial(MatchManager.remove_player, match_code, player_id),
+                )
+
+    @staticmethod
+    async def remove_player(match_code: str, player_id: str):
+        """Remove a player from the match, tell the others and move the game on"""
+        from ..game import PhaseManager
+
+        event_log.emit("player_left", match=match_code, player=player_id)
+        await MatchManager.reassign_host_if_needed(match_code, player_id)
         await WebSocketManager.broadcast_match_state(match_code)
-        return {"player_id": player_id, "name": player_name, "host": is_host}
+        await PhaseManager.handle_departure(match_code)
 
     @staticmethod
     async def reassign_host_if_needed(match_code: str, disconnected_player_id: str):
         """Reassign host to the first remaining player if the host disconnected"""
-        if match_code not in matches:
+        match = matches.get(match_code)
+        if match is None:
             return
 
-        if disconnected_player_id in matches[match_code]["players"]:
-            was_host = matches[match_code]["players"][disconnected_player_id]["host"]
-            del matches[match_code]["players"][disconnected_player_id]
+        player = match.remove_player(disconnected_player_id)
+        if player and player.host and match.players:
+            match.set_host(next(iter(match.players)))
+        lobby_index.update(match)
 
-            if was_host and matches[match_code]["players"]:
-                first_player_id = next(iter(matches[match_code]["players"]))
-                matches[match_code]["players"][first_player_id]["host"] = True
 
-                for player_id, player_data in matches[match_code]["players"].items():
-                    if player_id != first_player_id:
-                        player_data["host"] = False
+def _reconnect_timer(player_id: str) -> str:
+    """Name of the timer removing a disconnected player"""
+    return f"reconnect:{player_id}"
@@ -0,0 +1,243 @@
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+
+# Upper bounds in seconds, from 50us to 1s
+LATENCY_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    1.0,
+)
+PLAYER_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+
+_metrics: list["Metric"] = []
+# Called on every scrape for values that are cheaper to compute than to track
+_collectors: list[Callable[[], Iterable[str]]] = []
+
+
+class Counter:
+    """Monotonic count. Only touched from the event loop, so it needs no lock"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class Histogram:
+    """Observations counted into fixed buckets, without allocating per observation"""
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        # One count per bucket, plus the +Inf bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metric:
+    """A named counter or histogram, optionally split by the value of one label
+
+    Look children up once with labels() and keep them, so that recording a
+    value is a single attribute update.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        kind: str = "counter",
+        label: str | None = None,
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.label = label
+        self.buckets = buckets
+        self._children: dict[str, Counter | Histogram] = {}
+        _metrics.append(self)
+
+    def labels(self, value: str = "") -> Counter | Histogram:
+        child = self._children.get(value)
+        if child is None:
+            if self.kind == "histogram":
+                child = Histogram(self.buckets)
+            else:
+                child = Counter()
+            self._children[value] = child
+        return child
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for value, child in self._children.items():
+            labels = f'{self.label}="{value}"' if self.label else ""
+            if isinstance(child, Counter):
+                yield _sample(self.name, child.value, labels)
+            else:
+                yield from _render_histogram(self.name, child, labels)
+
+
+def register_collector(collector: Callable[[], Iterable[str]]):
+    """Add a function yielding exposition lines on every scrape"""
+    _collectors.append(collector)
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    lines.append("")
+    return "\n".join(lines)
+
+
+def gauge(name: str, documentation: str, samples: dict[str, float], label: str = ""):
+    """Exposition lines for a gauge, one sample per label value"""
+    yield f"# HELP {name} {documentation}"
+    yield f"# TYPE {name} gauge"
+    for value, sample in samples.items():
+        yield _sample(name, sample, f'{label}="{value}"' if label else "")
+
+
+def histogram_of(
+    name: str, documentation: str, values: Iterable[float], buckets: tuple[float, ...]
+):
+    """Exposition lines for a histogram of values known at scrape time"""
+    histogram = Histogram(buckets)
+    for value in values:
+        histogram.observe(value)
+    yield f"# HELP {name} {documentation}"
+    yield f"# TYPE {name} histogram"
+    yield from _render_histogram(name, histogram, "")
+
+
+def _sample(name: str, value: float, labels: str) -> str:
+    return f"{name}{{{labels}}} {value}" if labels else f"{name} {value}"
+
+
+def _render_histogram(name: str, histogram: Histogram, labels: str):
+    prefix = f"{labels}," if labels else ""
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        yield f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}'
+    cumulative += histogram.counts[-1]
+    yield f'{name}_bucket{{{prefix}le="+Inf"}} {cumulative}'
+    yield _sample(f"{name}_sum", histogram.sum, labels)
+    yield _sample(f"{name}_count", cumulative, labels)
+
+
+# Metrics recorded on hot paths
+HANDLER_SECONDS = Metric(
+    "impostor_message_handler_seconds",
+    "Time spent applying a websocket message, by message type",
+    "histogram",
+    label="type",
+)
+BROADCAST_SECONDS = Metric(
+    "impostor_broadcast_seconds",
+    "Time spent queueing one frame to every local socket of a match",
+    "histogram",
+).labels()
+BROADCAST_BYTES = Metric(
+    "impostor_broadcast_bytes_total",
+    "Bytes of broadcast frames queued to sockets",
+).labels()
+SENDS_DROPPED = Metric(
+    "impostor_sends_dropped_total",
+    "Frames dropped because a socket's outbound queue was full",
+).labels()
+SEND_FAILURES = Metric(
+    "impostor_send_failures_total",
+    "Socket writes that failed or timed out",
+).labels()
+SPECTATOR_SKIPS = Metric(
+    "impostor_spectator_skips_total",
+    "Times a spectator fell behind and skipped to the latest match state",
+).labels()
+INBOUND_REJECTED = Metric(
+    "impostor_inbound_rejected_total",
+    "Inbound websocket messages refused, by reason",
+    label="reason",
+)
+
+
+def _collect_state() -> Iterable[str]:
+    """Gauges read from the match and connection registries"""
+    from .eviction import eviction_stats
+    from .lobbies import lobby_index
+    from .state import matches, spectator_feeds, websocket_to_player
+
+    phases: dict[str, int] = {}
+    for match in matches.values():
+        phases[match.phase] = phases.get(match.phase, 0) + 1
+    yield from gauge(
+        "impostor_matches", "Matches on this worker, by phase", phases, "phase"
+    )
+    yield from gauge(
+        "impostor_open_lobbies",
+        "Public lobbies on this worker with room for another player",
+        {"": len(lobby_index)},
+    )
+    yield from histogram_of(
+        "impostor_match_players",
+        "Players per match on this worker",
+        (len(match.players) for match in matches.values()),
+        PLAYER_BUCKETS,
+    )
+
+    connections = websocket_to_player.values()
+    depths = [connection.queue_depth for connection in connections]
+    yield from gauge(
+        "impostor_connections", "Open sockets on this worker", {"": len(depths)}
+    )
+    yield from gauge(
+        "impostor_spectators",
+        "Spectator sockets on this worker",
+        {"": sum(feed.spectators for feed in spectator_feeds.values())},
+    )
+    yield from gauge(
+        "impostor_lagging_connections",
+        "Sockets whose outbound queue overflowed and has not drained yet",
+        {"": sum(connection.lagging for connection in connections)},
+    )
+    yield from gauge(
+        "impostor_outbound_queued_frames",
+        "Frames waiting in outbound queues",
+        {"": sum(depths)},
+    )
+    yield from gauge(
+        "impostor_outbound_queue_depth_max",
+        "Longest outbound queue",
+        {"": max(depths, default=0)},
+    )
+
+    yield "# HELP impostor_evictions_total Matches evicted, by reason"
+    yield "# TYPE impostor_evictions_total counter"
+    for reason in ("idle", "capacity"):
+        count = eviction_stats[f"evictions_{reason}"]
+        yield _sample("impostor_evictions_total", count, f'reason="{reason}"')
+
+
+register_collector(_collect_state)
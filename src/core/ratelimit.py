@@ -0,0 +1,24 @@
+import time
+
+
+class TokenBucket:
+    """Allows rate events per second on average, in bursts of up to burst"""
+
+    __slots__ = ("rate", "burst", "_tokens", "_updated")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def take(self) -> bool:
+        """Spend a token if one is available"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
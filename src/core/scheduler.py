@@ -0,0 +1,152 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections.abc import Awaitable, Callable
+
+from .actor import MatchActor
+
+
+class Timer:
+    """A pending callback registered with the scheduler"""
+
+    __slots__ = ("deadline", "match_code", "name", "callback", "cancelled")
+
+    def __init__(
+        self,
+        deadline: float,
+        match_code: str,
+        name: str,
+        callback: Callable[[], Awaitable[None]],
+    ):
+        self.deadline = deadline
+        self.match_code = match_code
+        self.name = name
+        self.callback = callback
+        self.cancelled = False
+
+
+class Scheduler:
+    """Process-wide timer heap, driven by a single task, for match deadlines"""
+
+    def __init__(
+        self,
+        clock: Callable[[], float] = time.monotonic,
+        dispatch: Callable[
+            [str, Callable[[], Awaitable[None]]], None
+        ] = MatchActor.post,
+    ):
+        self.clock = clock
+        # Hands a due callback to its match
+        self.dispatch = dispatch
+        self._heap: list[tuple[float, int, Timer]] = []
+        self._sequence = itertools.count()
+        self._timers: dict[str, dict[str, Timer]] = {}
+        self._cancelled = 0
+        self._task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def schedule(
+        self,
+        match_code: str,
+        name: str,
+        delay: float,
+        callback: Callable[[], Awaitable[None]],
+    ) -> Timer:
+        """Run callback after delay seconds, replacing the match's timer of that name"""
+        self.cancel(match_code, name)
+
+        timer = Timer(self.clock() + delay, match_code, name, callback)
+        heapq.heappush(self._heap, (timer.deadline, next(self._sequence), timer))
+        self._timers.setdefault(match_code, {})[name] = timer
+
+        if self._heap[0][2] is timer:
+            self._wakeup.set()
+        self._ensure_running()
+        return timer
+
+    def cancel(self, match_code: str, name: str):
+        """Cancel a match's timer by name, if it is pending"""
+        timers = self._timers.get(match_code)
+        if not timers or name not in timers:
+            return
+
+        self._discard(timers.pop(name))
+        if not timers:
+            del self._timers[match_code]
+
+    def cancel_match(self, match_code: str):
+        """Cancel every pending timer of a match"""
+        for timer in self._timers.pop(match_code, {}).values():
+            self._discard(timer)
+
+    def pending(self, match_code: str) -> dict[str, Timer]:
+        """Pending timers of a match by name"""
+        return self._timers.get(match_code, {})
+
+    def next_deadline(self) -> float | None:
+        """Deadline of the earliest pending timer"""
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+        return self._heap[0][0] if self._heap else None
+
+    async def run_due(self) -> int:
+        """Post every timer whose deadline has passed to its match. Returns how many"""
+        fired = 0
+        now = self.clock()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, timer = heapq.heappop(self._heap)
+            if timer.cancelled:
+                self._cancelled -= 1
+                continue
+
+            timers = self._timers[timer.match_code]
+            del timers[timer.name]
+            if not timers:
+                del self._timers[timer.match_code]
+
+            fired += 1
+            # Applied by the match actor, in order with the match's other commands
+            self.dispatch(timer.match_code, timer.callback)
+        return fired
+
+    def _discard(self, timer: Timer):
+        """Mark a timer cancelled, compacting the heap when mostly dead"""
+        timer.cancelled = True
+        self._cancelled += 1
+        if self._cancelled > 64 and self._cancelled > len(self._heap) // 2:
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # A fresh event loop (e.g. after a server restart in-process)
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = None
+
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self.run_due()
+
+            deadline = self.next_deadline()
+            self._wakeup.clear()
+            try:
+                if deadline is None:
+                    await self._wakeup.wait()
+                else:
+                    timeout = max(0.0, deadline - self.clock())
+                    async with asyncio.timeout(timeout):
+                        await self._wakeup.wait()
+            except TimeoutError:
+                pass
+
+
+scheduler = Scheduler()
@@ -0,0 +1,118 @@
+from decouple import config
+
+# Outbound websocket fan-out
+SEND_QUEUE_SIZE: int = config("SEND_QUEUE_SIZE", default=64, cast=int)
+SEND_TIMEOUT: float = config("SEND_TIMEOUT", default=5.0, cast=float)
+# What to do with a client whose outbound queue is full: "disconnect" or "flag"
+SLOW_CONSUMER_POLICY: str = config("SLOW_CONSUMER_POLICY", default="disconnect")
+# Merge match state updates produced within this many seconds into one frame
+# (0 merges the updates produced within one event loop tick)
+BROADCAST_COALESCE_WINDOW: float = config(
+    "BROADCAST_COALESCE_WINDOW", default=0.0, cast=float
+)
+# Public frames of a match kept for its spectators. A spectator further behind
+# skips to the latest match state
+SPECTATOR_BUFFER: int = config("SPECTATOR_BUFFER", default=64, cast=int)
+
+# Inbound websocket messages. Each socket may send INBOUND_RATE messages per
+# second on average, in bursts of up to INBOUND_BURST
+INBOUND_RATE: float = config("INBOUND_RATE", default=10.0, cast=float)
+INBOUND_BURST: int = config("INBOUND_BURST", default=20, cast=int)
+MAX_FRAME_BYTES: int = config("MAX_FRAME_BYTES", default=4096, cast=int)
+# Largest frame uvicorn accepts before closing the socket with 1009. Keep it
+# well above MAX_FRAME_BYTES, so larger messages reach INBOUND_ABUSE_POLICY
+WS_MAX_SIZE: int = config("WS_MAX_SIZE", default=65536, cast=int)
+MAX_PROPOSITION_LENGTH: int = config("MAX_PROPOSITION_LENGTH", default=100, cast=int)
+# What to do with a rejected message: "drop" it, "warn" the client once per
+# streak of rejections, or "disconnect" the client
+INBOUND_ABUSE_POLICY: str = config("INBOUND_ABUSE_POLICY", default="warn")
+
+# Heartbeats: every HEARTBEAT_INTERVAL seconds each socket is pinged (0
+# disables heartbeats), and sockets sending nothing, not even a pong, for
+# HEARTBEAT_TIMEOUT seconds are closed. The timeout is off (0) by default, as
+# clients that do not answer pings would be dropped while idle; dead sockets
+# are still detected by uvicorn's protocol-level pings (ws_ping_interval)
+HEARTBEAT_INTERVAL: float = config("HEARTBEAT_INTERVAL", default=15.0, cast=float)
+HEARTBEAT_TIMEOUT: float = config("HEARTBEAT_TIMEOUT", default=0.0, cast=float)
+# Seconds a disconnected player is kept so they can reattach with their
+# session token, before being removed from the match (0 removes right away)
+RECONNECT_GRACE: float = config("RECONNECT_GRACE", default=30.0, cast=float)
+# Refuse player sockets without ?token=<session token>, so nobody can receive
+# another player's role by connecting with their id. Off until every client
+# sends the token returned by /match/join
+REQUIRE_SESSION_TOKEN: bool = config("REQUIRE_SESSION_TOKEN", default=False, cast=bool)
+
+# Commands a match actor applies before broadcasting and yielding to others
+ACTOR_BATCH_SIZE: int = config("ACTOR_BATCH_SIZE", default=32, cast=int)
+
+# Phase timers, in seconds (0 disables the time limit)
+REVEAL_DURATION: float = config("REVEAL_DURATION", default=5.0, cast=float)
+DISCUSSION_TIME_LIMIT: float = config("DISCUSSION_TIME_LIMIT", default=0.0, cast=float)
+VOTE_TIME_LIMIT: float = config("VOTE_TIME_LIMIT", default=0.0, cast=float)
+
+# Broadcast the running vote tally after every vote
+LIVE_VOTE_TALLY: bool = config("LIVE_VOTE_TALLY", default=False, cast=bool)
+
+# Idle match eviction. TTLs are seconds since the last player activity
+MATCH_TTL_LOBBY: float = config("MATCH_TTL_LOBBY", default=3600.0, cast=float)
+MATCH_TTL_IN_GAME: float = config("MATCH_TTL_IN_GAME", default=7200.0, cast=float)
+MATCH_TTL_GAME_OVER: float = config("MATCH_TTL_GAME_OVER", default=600.0, cast=float)
+MATCH_TTL_EMPTY: float = config("MATCH_TTL_EMPTY", default=120.0, cast=float)
+REAPER_INTERVAL: float = config("REAPER_INTERVAL", default=30.0, cast=float)
+# Hard cap on live matches; the least recently active is evicted (0 = no cap)
+MAX_MATCHES: int = config("MAX_MATCHES", default=0, cast=int)
+# Players a match admits; quick matches only place players in lobbies below it
+MAX_PLAYERS: int = config("MAX_PLAYERS", default=20, cast=int)
+# Open lobbies returned per page at most
+LOBBY_PAGE_LIMIT: int = config("LOBBY_PAGE_LIMIT", default=100, cast=int)
+# Deepest offset a lobby listing pages to, since every worker is asked for the
+# lobbies up to offset + limit
+LOBBY_MAX_OFFSET: int = config("LOBBY_MAX_OFFSET", default=1000, cast=int)
+# How many evicted match codes to remember for "Match expired" errors
+EVICTED_MATCH_MEMORY: int = config("EVICTED_MATCH_MEMORY", default=10000, cast=int)
+
+# Workers sharing the match code space. Every worker must use the same CODE_SEED,
+# which is required with BUS_URL
+WORKER_ID: int = config("WORKER_ID", default=0, cast=int)
+WORKER_COUNT: int = config("WORKER_COUNT", default=1, cast=int)
+CODE_SEED: str = config("CODE_SEED", default="")
+# Released match codes are only reused once this many are waiting
+CODE_RECYCLE_QUARANTINE: int = config(
+    "CODE_RECYCLE_QUARANTINE", default=10000, cast=int
+)
+
+# Bus between workers: "" keeps every match in this process, "tcp://host:port"
+# connects to a hub (python main.py hub host port) shared by all workers
+BUS_URL: str = config("BUS_URL", default="")
+# How long a command forwarded to the worker owning a match may take, in seconds
+CLUSTER_CALL_TIMEOUT: float = config("CLUSTER_CALL_TIMEOUT", default=10.0, cast=float)
+
+# Match persistence: directory for the journal and snapshots ("" disables it)
+JOURNAL_DIR: str = config("JOURNAL_DIR", default="")
+# Journal records are fsynced together at most this often, in seconds
+JOURNAL_COMMIT_INTERVAL: float = config(
+    "JOURNAL_COMMIT_INTERVAL", default=0.05, cast=float
+)
+# Seconds between snapshots, which bounds how much journal recovery replays
+JOURNAL_SNAPSHOT_INTERVAL: float = config(
+    "JOURNAL_SNAPSHOT_INTERVAL", default=60.0, cast=float
+)
+
+# File matches are exported to on SIGTERM and imported from at startup, for
+# handing them to a replacement process during a rolling deploy ("" to disable)
+HANDOFF_FILE: str = config("HANDOFF_FILE", default="")
+# Bearer token for the /admin endpoints ("" disables them)
+ADMIN_TOKEN: str = config("ADMIN_TOKEN", default="")
+
+# Structured event log: "stdout", "stderr", a file path, or "" to disable
+EVENT_LOG: str = config("EVENT_LOG", default="stdout")
+# Events waiting to be written; further events are dropped until there is room
+EVENT_QUEUE_SIZE: int = config("EVENT_QUEUE_SIZE", default=10000, cast=int)
+# Fraction of each event kept, e.g. "vote_cast=0.1" (unlisted events are all kept)
+EVENT_SAMPLE_RATES: str = config("EVENT_SAMPLE_RATES", default="")
+
+# JSON encoder for outgoing messages: "json" or "orjson" (if installed)
+JSON_CODEC: str = config("JSON_CODEC", default="json")
+
+# Longest time a GET /match/{match_code}/state long-poll is held, in seconds
+LONG_POLL_MAX_WAIT: float = config("LONG_POLL_MAX_WAIT", default=30.0, cast=float)
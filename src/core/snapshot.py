@@ -0,0 +1,41 @@
+from ..models import Match
+from .codec import encode
+
+STATE_UPDATE_PREFIX = b'{"type":"match_state_update",'
+
+
+class Snapshot:
+    """Client-visible match state at one version, encoded once for every reader"""
+
+    __slots__ = ("version", "etag", "info", "body", "frame")
+
+    def __init__(self, match: Match):
+        self.version = match.version
+        self.etag = f'"{match.version}"'
+        self.info = {
+            "phase": match.phase,
+            "can_start": match.can_start,
+            "round": match.round,
+            "version": match.version,
+            "players": [
+                {
+                    "id": player_id,
+                    "name": player.name,
+                    "host": player.host,
+                    "ready_to_vote": player.ready_to_vote,
+                    "alive": player.alive,
+                }
+                for player_id, player in match.players.items()
+            ],
+        }
+        # REST body, and the same bytes spliced into a match_state_update frame
+        self.body = encode(self.info)
+        self.frame = (STATE_UPDATE_PREFIX + self.body[1:]).decode()
+
+    @staticmethod
+    def of(match: Match) -> "Snapshot":
+        """Cached snapshot of a match, rebuilt only if the match changed since"""
+        snapshot = match.snapshot
+        if snapshot is None or snapshot.version != match.version:
+            snapshot = match.snapshot = Snapshot(match)
+        return snapshot
@@ -0,0 +1,108 @@
+import asyncio
+from collections import deque
+
+from fastapi import WebSocket
+
+from .metrics import SEND_FAILURES, SPECTATOR_SKIPS
+from .settings import SEND_TIMEOUT, SPECTATOR_BUFFER
+
+
+class SpectatorFeed:
+    """Public frames of one match, shared by every spectator on this worker
+
+    Frames go into one bounded buffer instead of a queue per spectator, so
+    publishing costs the same for one spectator or thousands, and a slow
+    spectator never holds back the match. Each spectator follows the buffer
+    at its own pace. One that falls out of it skips to the latest match
+    state and carries on from there.
+    """
+
+    __slots__ = (
+        "match_code",
+        "spectators",
+        "closed",
+        "_frames",
+        "_next",
+        "_state",
+        "_state_sequence",
+        "_changed",
+        "_close_code",
+        "_close_reason",
+    )
+
+    def __init__(self, match_code: str):
+        self.match_code = match_code
+        self.spectators = 0
+        self.closed = False
+        self._frames: deque[str] = deque(maxlen=SPECTATOR_BUFFER)
+        # Sequence number the next published frame gets
+        self._next = 0
+        self._state: str | None = None
+        self._state_sequence = -1
+        self._changed = asyncio.Event()
+        self._close_code = 1000
+        self._close_reason: str | None = None
+
+    @property
+    def _first(self) -> int:
+        """Sequence number of the oldest frame still buffered"""
+        return self._next - len(self._frames)
+
+    def publish(self, frame: str, state: bool = False):
+        """Buffer a public frame for every spectator. state marks full match states"""
+        if state:
+            self._state = frame
+            self._state_sequence = self._next
+        self._frames.append(frame)
+        self._next += 1
+        # Wakes every waiting writer; clearing right away does not un-wake them
+        self._changed.set()
+        self._changed.clear()
+
+    def close(self, code: int = 1000, reason: str | None = None):
+        """Close the socket of every spectator"""
+        self.closed = True
+        self._close_code = code
+        self._close_reason = reason
+        self._changed.set()
+
+    def position(self) -> int:
+        """Where a spectator joining now starts following"""
+        return self._next
+
+    async def follow(self, websocket: WebSocket, cursor: int, state: str | None):
+        """Write state, then the frames published from cursor on, to a spectator"""
+        try:
+            if state is not None:
+                async with asyncio.timeout(SEND_TIMEOUT):
+                    await websocket.send_text(state)
+
+            while not self.closed:
+                if cursor == self._next:
+                    await self._changed.wait()
+                    continue
+
+                if cursor < self._first:
+                    # Fell out of the buffer: skip to the latest state
+                    SPECTATOR_SKIPS.inc()
+                    frame = self._state
+                    cursor = max(self._state_sequence + 1, self._first)
+                else:
+                    frame = self._frames[cursor - self._first]
+                    cursor += 1
+
+                if frame is not None:
+                    async with asyncio.timeout(SEND_TIMEOUT):
+                        await websocket.send_text(frame)
+            code, reason = self._close_code, self._close_reason
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            SEND_FAILURES.inc()
+            code, reason = 1011, None
+
+        try:
+            async with asyncio.timeout(SEND_TIMEOUT):
+                await websocket.close(code, reason)
+        except Exception:
+            pass
@@ -1,6 +1,15 @@
+from collections import OrderedDict
 from fastapi import WebSocket
 
+from ..models import Match
+from .connection import Connection
+from .spectators import SpectatorFeed
+
 # Global state storage
-active_connections: dict[str, list[WebSocket]] = {}
-websocket_to_player: dict[WebSocket, dict] = {}
-matches: dict[str, dict] = {}
+active_connections: dict[str, list[Connection]] = {}
+websocket_to_player: dict[WebSocket, Connection] = {}
+player_connections: dict[tuple[str, str], Connection] = {}
+spectator_feeds: dict[str, SpectatorFeed] = {}
+# Ordered from least to most recently active
+matches: OrderedDict[str, Match] = OrderedDict()
+evicted_matches: OrderedDict[str, None] = OrderedDict()
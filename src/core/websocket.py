@@ -1,62 +1,337 @@
-import json
-from .state import active_connections, websocket_to_player
+import asyncio
+import time
+from fastapi import WebSocket
+
+from .bus import bus
+from .codec import encode_text
+from .connection import Connection
+from .metrics import BROADCAST_BYTES, BROADCAST_SECONDS
+from .settings import BROADCAST_COALESCE_WINDOW
+from .snapshot import Snapshot
+from .spectators import SpectatorFeed
+from .state import (
+    active_connections,
+    websocket_to_player,
+    player_connections,
+    matches,
+    spectator_feeds,
+)
+
+# Matches with a state broadcast waiting to be flushed, and the scheduled flush
+_pending_state_broadcasts: dict[str, asyncio.TimerHandle | asyncio.Handle] = {}
+# Set (and replaced) whenever a match state broadcast is flushed
+_state_waiters: dict[str, asyncio.Event] = {}
 
 
 class WebSocketManager:
+    @staticmethod
+    def connect(
+        websocket: WebSocket, match_code: str, player_id: str, delta: bool = False
+    ) -> Connection:
+        """Register an accepted websocket for a player in a match"""
+        connection = Connection(
+            websocket, match_code, player_id, WebSocketManager.disconnect, delta
+        )
+
+        if match_code not in active_connections:
+            WebSocketManager._watch(match_code)
+            active_connections[match_code] = []
+        active_connections[match_code].append(connection)
+
+        websocket_to_player[websocket] = connection
+        player_connections[(match_code, player_id)] = connection
+        return connection
+
+    @staticmethod
+    def disconnect(connection: Connection):
+        """Unregister a connection. Safe to call more than once"""
+        if websocket_to_player.get(connection.websocket) is connection:
+            del websocket_to_player[connection.websocket]
+
+        key = (connection.match_code, connection.player_id)
+        if player_connections.get(key) is connection:
+            del player_connections[key]
+
+        connections = active_connections.get(connection.match_code)
+        if connections and connection in connections:
+            connections.remove(connection)
+            if not connections:
+                del active_connections[connection.match_code]
+                WebSocketManager._unwatch(connection.match_code)
+
+        connection.close()
+
+    @staticmethod
+    def add_spectator(match_code: str) -> SpectatorFeed:
+        """Register a spectator of a match and return the feed it follows"""
+        feed = spectator_feeds.get(match_code)
+        if feed is None or feed.closed:
+            WebSocketManager._watch(match_code)
+            feed = spectator_feeds[match_code] = SpectatorFeed(match_code)
+        feed.spectators += 1
+        return feed
+
+    @staticmethod
+    def remove_spectator(feed: SpectatorFeed):
+        """Unregister a spectator, dropping the feed after its last one"""
+        feed.spectators -= 1
+        if feed.spectators == 0 and spectator_feeds.get(feed.match_code) is feed:
+            del spectator_feeds[feed.match_code]
+            WebSocketManager._unwatch(feed.match_code)
+
+    @staticmethod
+    def _watch(match_code: str):
+        """Subscribe to a match's channel before its first local socket is added"""
+        if match_code not in active_connections and match_code not in spectator_feeds:
+            bus.subscribe(match_code)
+
+    @staticmethod
+    def _unwatch(match_code: str):
+        """Unsubscribe from a match's channel once its last local socket is gone"""
+        if match_code not in active_connections and match_code not in spectator_feeds:
+            bus.unsubscribe(match_code)
+
+    @staticmethod
+    def _has_audience(match_code: str) -> bool:
+        """Whether frames of a match may have a reader, here or on another worker"""
+        return (
+            match_code in active_connections
+            or match_code in spectator_feeds
+            or bus.clustered
+        )
+
     @staticmethod
     async def broadcast_to_match(match_code: str, message: dict):
         """Broadcast a message to all connected clients in the match"""
-        if match_code not in active_connections:
+        if not WebSocketManager._has_audience(match_code):
             return
 
-        message_json = json.dumps(message)
-        disconnected_websockets = []
-        for websocket in active_connections[match_code]:
-            try:
-                await websocket.send_text(message_json)
-            except Exception:
-                disconnected_websockets.append(websocket)
+        WebSocketManager.broadcast_frame(match_code, encode_text(message))
 
-        for websocket in disconnected_websockets:
-            active_connections[match_code].remove(websocket)
+    @staticmethod
+    def broadcast_frame(match_code: str, frame: str):
+        """Queue an already encoded frame to all connected clients in the match"""
+        WebSocketManager.flush_match_state(match_code)
+        if bus.clustered:
+            bus.publish(match_code, {"type": "frame", "frame": frame})
+        WebSocketManager._send_frame(match_code, frame)
 
     @staticmethod
-    async def broadcast_phase_change(match_code: str, new_phase: str):
+    def _send_frame(match_code: str, frame: str):
+        """Queue a frame to the clients of a match connected to this worker"""
+        feed = spectator_feeds.get(match_code)
+        if feed is not None:
+            feed.publish(frame)
+
+        connections = active_connections.get(match_code)
+        if not connections:
+            return
+
+        started = time.perf_counter()
+        sent = 0
+        # Sending never waits on a client; slow or dead ones may be pruned meanwhile
+        for connection in list(connections):
+            sent += connection.send(frame)
+
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
+        BROADCAST_BYTES.inc(_frame_size(frame) * sent)
+
+    @staticmethod
+    async def broadcast_phase_change(
+        match_code: str, new_phase: str, time_limit: float = 0
+    ):
         """Broadcast a phase change event to all connected clients in the match"""
         message = {"type": "phase_change", "phase": new_phase}
+        if time_limit > 0:
+            message["time_limit"] = time_limit
         await WebSocketManager.broadcast_to_match(match_code, message)
+        # Phase changes also change the match state itself
+        await WebSocketManager.broadcast_match_state(match_code)
 
     @staticmethod
     async def send_private_message(match_code: str, player_id: str, message: dict):
         """Send a private message to a specific player"""
-        if match_code not in active_connections:
-            return
+        WebSocketManager.flush_match_state(match_code)
+        connection = player_connections.get((match_code, player_id))
+        if connection:
+            connection.send(encode_text(message))
+        elif bus.clustered:
+            frames = {player_id: encode_text(message)}
+            bus.publish(match_code, {"type": "frames", "frames": frames})
+
+    @staticmethod
+    async def send_personalized(match_code: str, messages: dict[str, dict]):
+        """Send each player their own message in a single pass over the match"""
+        WebSocketManager.flush_match_state(match_code)
+        # Players sharing the same message object share one encoded frame
+        encoded: dict[int, str] = {}
+        remote: dict[str, str] = {}
+        for player_id, message in messages.items():
+            connection = player_connections.get((match_code, player_id))
+            if not connection and not bus.clustered:
+                continue
 
-        message_json = json.dumps(message)
-        for websocket in active_connections[match_code]:
-            if websocket in websocket_to_player:
-                player_info = websocket_to_player[websocket]
-                if (
-                    player_info["match_code"] == match_code
-                    and player_info["player_id"] == player_id
-                ):
-                    try:
-                        await websocket.send_text(message_json)
-                    except Exception:
-                        pass
-                    break
+            message_json = encoded.get(id(message))
+            if message_json is None:
+                message_json = encoded[id(message)] = encode_text(message)
+            if connection:
+                connection.send(message_json)
+            else:
+                remote[player_id] = message_json
+
+        if remote:
+            bus.publish(match_code, {"type": "frames", "frames": remote})
 
     @staticmethod
     async def broadcast_match_state(match_code: str):
-        """Broadcast the current match state to all connected clients in the match"""
-        if match_code not in active_connections:
+        """Broadcast the current match state to all connected clients in the match
+
+        Updates requested within one event loop tick, or within
+        BROADCAST_COALESCE_WINDOW seconds, go out as a single frame. Any other
+        message sent to the match flushes a pending update first, so clients
+        still see messages in the order they were produced.
+        """
+        if match_code in _pending_state_broadcasts:
             return
 
-        from .match import MatchManager
+        loop = asyncio.get_running_loop()
+        if BROADCAST_COALESCE_WINDOW > 0:
+            handle = loop.call_later(
+                BROADCAST_COALESCE_WINDOW,
+                WebSocketManager.flush_match_state,
+                match_code,
+            )
+        else:
+            handle = loop.call_soon(WebSocketManager.flush_match_state, match_code)
+        _pending_state_broadcasts[match_code] = handle
 
-        match_info = MatchManager.get_match_info(match_code)
-        if not match_info:
+    @staticmethod
+    def flush_match_state(match_code: str):
+        """Send a pending match state broadcast now, if there is one"""
+        handle = _pending_state_broadcasts.pop(match_code, None)
+        if handle is None:
             return
+        handle.cancel()
+        WebSocketManager.wake_state_waiters(match_code)
 
-        message = {"type": "match_state_update", **match_info}
-        await WebSocketManager.broadcast_to_match(match_code, message)
+        match = matches.get(match_code)
+        if match is None:
+            return
+
+        # Always taken, so the next patch starts from what was last broadcast
+        patch = match.take_patch()
+        if not WebSocketManager._has_audience(match_code):
+            return
+
+        full_frame = Snapshot.of(match).frame
+        patch_frame = None
+        if patch is not None:
+            patch_frame = encode_text({"type": "match_state_patch", **patch})
+
+        if bus.clustered:
+            state = {"type": "state", "full": full_frame, "patch": patch_frame}
+            bus.publish(match_code, state)
+        WebSocketManager._send_state(match_code, full_frame, patch_frame)
+
+    @staticmethod
+    def _send_state(match_code: str, full_frame: str, patch_frame: str | None):
+        """Queue a state update to the clients of a match connected to this worker"""
+        feed = spectator_feeds.get(match_code)
+        if feed is not None:
+            feed.publish(full_frame, state=True)
+
+        connections = active_connections.get(match_code)
+        if not connections:
+            return
+
+        started = time.perf_counter()
+        full_sent = patch_sent = 0
+        for connection in list(connections):
+            if not connection.delta:
+                full_sent += connection.send(full_frame)
+            elif patch_frame is not None:
+                patch_sent += connection.send(patch_frame)
+
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
+        sent_bytes = _frame_size(full_frame) * full_sent
+        if patch_sent:
+            sent_bytes += _frame_size(patch_frame) * patch_sent
+        BROADCAST_BYTES.inc(sent_bytes)
+
+    @staticmethod
+    def close_match(match_code: str, code: int, reason: str):
+        """Close every connection to a match, on every worker"""
+        if bus.clustered:
+            bus.publish(match_code, {"type": "close", "code": code, "reason": reason})
+        WebSocketManager._close_connections(match_code, code, reason)
+
+    @staticmethod
+    def _close_connections(match_code: str, code: int, reason: str):
+        for connection in list(active_connections.get(match_code, ())):
+            connection.close(code, reason)
+
+        feed = spectator_feeds.get(match_code)
+        if feed is not None:
+            feed.close(code, reason)
+
+    @staticmethod
+    def deliver(message: dict):
+        """Deliver a message published by the worker owning a match"""
+        match_code = message["channel"]
+        kind = message["type"]
+        if kind == "frame":
+            WebSocketManager._send_frame(match_code, message["frame"])
+        elif kind == "frames":
+            for player_id, frame in message["frames"].items():
+                connection = player_connections.get((match_code, player_id))
+                if connection:
+                    connection.send(frame)
+        elif kind == "state":
+            WebSocketManager._send_state(match_code, message["full"], message["patch"])
+        elif kind == "close":
+            WebSocketManager._close_connections(
+                match_code, message["code"], message["reason"]
+            )
+
+    @staticmethod
+    def get_state_frame(match_code: str) -> str | None:
+        """Full match state frame, e.g. to resync a client after a gap"""
+        WebSocketManager.flush_match_state(match_code)
+        match = matches.get(match_code)
+        if match is None:
+            return None
+        return Snapshot.of(match).frame
+
+    @staticmethod
+    def wake_state_waiters(match_code: str):
+        """Wake requests long-polling the state of a match"""
+        event = _state_waiters.pop(match_code, None)
+        if event is not None:
+            event.set()
+
+    @staticmethod
+    async def wait_for_state_change(match_code: str, version: int, timeout: float):
+        """Wait until the match state moves past version, the match is gone or timeout"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            match = matches.get(match_code)
+            if match is None or match.version != version:
+                return
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+
+            if match_code not in _state_waiters:
+                _state_waiters[match_code] = asyncio.Event()
+            try:
+                async with asyncio.timeout(remaining):
+                    await _state_waiters[match_code].wait()
+            except TimeoutError:
+                return
+
+
+def _frame_size(frame: str) -> int:
+    """Encoded size of a text frame, without encoding ASCII frames"""
+    return len(frame) if frame.isascii() else len(frame.encode())
@@ -0,0 +1,5 @@
+import random
+
+# Source of every random choice made by the game rules. Seeding it, e.g. from
+# a simulation, makes a sequence of games repeat exactly
+rng = random.Random()
@@ -1,33 +1,114 @@
+from functools import partial
+
+from ..core.scheduler import scheduler
+from ..core.settings import DISCUSSION_TIME_LIMIT, REVEAL_DURATION, VOTE_TIME_LIMIT
 from ..core.state import matches
 from ..core.websocket import WebSocketManager
 
+DISCUSSION_PHASES = ("role_assignment", "round")
+
 
 class PhaseManager:
     @staticmethod
     async def handle_voting_readiness(match_code: str, player_id: str, readiness: bool):
         """Handle a player's voting readiness and check for phase transition"""
-        if match_code not in matches:
+        match = matches.get(match_code)
+        if match is None:
             return
 
-        if player_id not in matches[match_code]["players"]:
+        if player_id not in match.players:
             return
 
-        matches[match_code]["players"][player_id]["ready_to_vote"] = readiness
+        match.set_ready(player_id, readiness)
+
+        await WebSocketManager.broadcast_match_state(match_code)
 
-        all_ready_to_vote = True
-        alive_players = []
+        if match.all_ready_to_vote and match.phase in DISCUSSION_PHASES:
+            await PhaseManager.start_voting(match_code)
 
-        for pid, player_data in matches[match_code]["players"].items():
-            if player_data["alive"]:
-                alive_players.append(pid)
-                if not player_data["ready_to_vote"]:
-                    all_ready_to_vote = False
+    @staticmethod
+    async def start_discussion(match_code: str, phase: str):
+        """Enter a discussion phase, bounded by the discussion time limit if set"""
+        matches[match_code].set_phase(phase)
+        scheduler.cancel(match_code, "phase")
 
-        await WebSocketManager.broadcast_match_state(match_code)
+        if DISCUSSION_TIME_LIMIT > 0:
+            scheduler.schedule(
+                match_code,
+                "phase",
+                DISCUSSION_TIME_LIMIT,
+                partial(PhaseManager.start_voting, match_code),
+            )
+
+        await WebSocketManager.broadcast_phase_change(
+            match_code, phase, DISCUSSION_TIME_LIMIT
+        )
+
+    @staticmethod
+    async def start_voting(match_code: str):
+        """Enter the voting phase, bounded by the vote time limit if set"""
+        match = matches.get(match_code)
+        if match is None:
+            return
+
+        match.reset_readiness()
+        match.set_phase("voting")
+        scheduler.cancel(match_code, "phase")
+
+        if VOTE_TIME_LIMIT > 0:
+            from .voting import VoteManager
+
+            scheduler.schedule(
+                match_code,
+                "phase",
+                VOTE_TIME_LIMIT,
+                partial(VoteManager.close_voting, match_code),
+            )
+
+        await WebSocketManager.broadcast_phase_change(
+            match_code, "voting", VOTE_TIME_LIMIT
+        )
+
+    @staticmethod
+    async def handle_departure(match_code: str):
+        """Move a match on if the players who left completed its phase or decided it
+
+        A match waiting for everyone to be ready or to vote would otherwise
+        wait on a player who is gone, forever without a time limit.
+        """
+        match = matches.get(match_code)
+        # The reveal timer checks the win conditions on its own
+        if match is None or match.alive_count == 0 or match.phase == "reveal":
+            return
+        if match.phase not in DISCUSSION_PHASES and match.phase != "voting":
+            return
+
+        from .voting import VoteManager
+
+        if match.alive_impostors == 0 or match.alive_impostors >= match.alive_count / 2:
+            await VoteManager._check_win_conditions_and_continue(match_code)
+        elif match.phase in DISCUSSION_PHASES and match.all_ready_to_vote:
+            await PhaseManager.start_voting(match_code)
+        elif match.phase == "voting" and match.all_voted:
+            await VoteManager.close_voting(match_code)
+
+    @staticmethod
+    def resume(match_code: str):
+        """Restart the phase timer of a match restored after a restart"""
+        match = matches.get(match_code)
+        if match is None:
+            return
 
-        if all_ready_to_vote and len(alive_players) > 0:
-            for pid, player_data in matches[match_code]["players"].items():
-                player_data["ready_to_vote"] = False
+        from .voting import VoteManager
 
-            matches[match_code]["phase"] = "voting"
-            await WebSocketManager.broadcast_phase_change(match_code, "voting")
+        if match.phase in DISCUSSION_PHASES and DISCUSSION_TIME_LIMIT > 0:
+            callback = partial(PhaseManager.start_voting, match_code)
+            scheduler.schedule(match_code, "phase", DISCUSSION_TIME_LIMIT, callback)
+        elif match.phase == "voting" and VOTE_TIME_LIMIT > 0:
+            callback = partial(VoteManager.close_voting, match_code)
+            scheduler.schedule(match_code, "phase", VOTE_TIME_LIMIT, callback)
+        elif match.phase == "reveal":
+            callback = partial(
+                VoteManager._check_win_conditions_and_continue, match_code
+            )
+            scheduler.schedule(match_code, "phase", REVEAL_DURATION, callback)
@@ -1,7 +1,9 @@
-import random
+from ..core.events import event_log
+from ..core.lobbies import lobby_index
 from ..core.state import matches
 from ..core.websocket import WebSocketManager
-from ..core.match import MatchManager
+from .chance import rng
+from .phases import PhaseManager
 
 
 class RoleManager:
@@ -10,74 +12,72 @@ class RoleManager:
         match_code: str, player_id: str, proposition: str
     ):
         """Handle a player's role proposition"""
-        if match_code not in matches:
+        match = matches.get(match_code)
+        if match is None:
             return
 
-        if player_id not in matches[match_code]["players"]:
+        if player_id not in match.players:
             return
 
-        matches[match_code]["propositions"][player_id] = proposition
+        match.set_proposition(player_id, proposition)
 
         if proposition and proposition.strip():
-            matches[match_code]["can_start"] = True
+            match.set_can_start(True)
             await WebSocketManager.broadcast_match_state(match_code)
 
     @staticmethod
     async def assign_roles_and_start(match_code: str):
         """Assign roles and start the match"""
-        if match_code not in matches:
+        match = matches.get(match_code)
+        if match is None:
             return {"error": "Match not found"}
 
-        match_info = MatchManager.get_match_info(match_code)
-        if not match_info or len(match_info["players"]) < 3:
+        if len(match.players) < 3:
             return {"error": "Need at least 3 connected players to start"}
 
-        if not matches[match_code]["can_start"]:
+        if not match.can_start:
             return {"error": "Need at least one role proposition to start"}
 
-        connected_players = match_info["players"]
-        impostor_player = random.choice(connected_players)
-        impostor_id = impostor_player["id"]
+        connected_players = list(match.players)
+        impostor_id = rng.choice(connected_players)
 
         available_propositions = []
-        propositions = matches[match_code]["propositions"]
+        propositions = match.propositions
 
-        for player in connected_players:
-            player_id = player["id"]
+        for player_id in connected_players:
             if player_id != impostor_id and player_id in propositions:
                 proposition = propositions[player_id].strip()
                 if proposition:
                     available_propositions.append(proposition)
 
         if available_propositions:
-            selected_role = random.choice(available_propositions)
+            selected_role = rng.choice(available_propositions)
         else:
             selected_role = "Kanye West"
 
-        matches[match_code]["secret_character"] = selected_role
+        match.set_secret_character(selected_role)
 
-        for player in connected_players:
-            if player["id"] == impostor_id:
-                matches[match_code]["players"][player["id"]]["role"] = "impostor"
+        for player_id in connected_players:
+            if player_id == impostor_id:
+                match.set_role(player_id, "impostor")
             else:
-                matches[match_code]["players"][player["id"]]["role"] = (
-                    selected_role.title()
-                )
+                match.set_role(player_id, selected_role.title())
 
-        matches[match_code]["phase"] = "role_assignment"
-        await WebSocketManager.broadcast_phase_change(match_code, "role_assignment")
+        event_log.emit(
+            "match_started", match=match_code, players=len(connected_players)
+        )
+        await PhaseManager.start_discussion(match_code, "role_assignment")
+        lobby_index.update(match)
 
         # Send each player their role privately
-        for player in connected_players:
-            player_role = matches[match_code]["players"][player["id"]]["role"]
-            if player_role == "impostor":
-                role_to_send = "impostor"
-            else:
-                role_to_send = selected_role
-
-            private_message = {"type": "role_assignment", "role": role_to_send}
-            await WebSocketManager.send_private_message(
-                match_code, player["id"], private_message
+        impostor_message = {"type": "role_assignment", "role": "impostor"}
+        normal_message = {"type": "role_assignment", "role": selected_role}
+        role_messages = {
+            player_id: (
+                impostor_message if player_id == impostor_id else normal_message
             )
+            for player_id in connected_players
+        }
+        await WebSocketManager.send_personalized(match_code, role_messages)
 
         return {"success": True, "phase": "role_assignment"}
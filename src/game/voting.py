@@ -1,76 +1,73 @@
-import random
-import asyncio
+from functools import partial
+
+from ..core.events import event_log
+from ..core.scheduler import scheduler
+from ..core.settings import LIVE_VOTE_TALLY, REVEAL_DURATION
 from ..core.state import matches
 from ..core.websocket import WebSocketManager
+from .chance import rng
+from .phases import PhaseManager
 
 
 class VoteManager:
     @staticmethod
     def _validate_vote(match_code: str, player_id: str) -> bool:
         """Validate if a player can vote"""
-        if match_code not in matches:
+        match = matches.get(match_code)
+        if match is None:
             return False
 
-        if player_id not in matches[match_code]["players"]:
+        player = match.players.get(player_id)
+        if player is None:
             return False
 
-        if not matches[match_code]["players"][player_id]["alive"]:
+        if not player.alive:
             return False
 
-        if player_id in matches[match_code]["votes"]:
+        if match.phase != "voting":
             return False
 
         return True
 
     @staticmethod
-    def _store_vote(match_code: str, player_id: str, target_id: str):
-        """Store a player's vote"""
-        matches[match_code]["votes"][player_id] = target_id
+    def _validate_target(match_code: str, target_id: str) -> bool:
+        """Validate if a player can be voted for"""
+        target = matches[match_code].players.get(target_id)
+        return target is not None and target.alive
 
     @staticmethod
-    def _get_alive_players(match_code: str) -> list[str]:
-        """Get list of alive player IDs"""
-        alive_players = []
-        for pid, player_data in matches[match_code]["players"].items():
-            if player_data["alive"]:
-                alive_players.append(pid)
-        return alive_players
+    def _store_vote(match_code: str, player_id: str, target_id: str):
+        """Store or change a player's vote"""
+        matches[match_code].record_vote(player_id, target_id)
 
     @staticmethod
     def _all_players_voted(match_code: str) -> bool:
         """Check if all alive players have voted"""
-        alive_players = VoteManager._get_alive_players(match_code)
-        voted_players = set(matches[match_code]["votes"].keys())
-        alive_players_set = set(alive_players)
-
-        return voted_players >= alive_players_set and len(alive_players) > 0
+        return matches[match_code].all_voted
 
     @staticmethod
     async def _process_elimination(match_code: str) -> str | None:
-        """Count votes and eliminate the most voted player. Returns eliminated player ID."""
-        vote_counts = {}
-        for voter, target in matches[match_code]["votes"].items():
-            if target in vote_counts:
-                vote_counts[target] += 1
-            else:
-                vote_counts[target] = 1
-
-        if not vote_counts:
+        """Eliminate the most voted player. Returns eliminated player ID."""
+        match = matches[match_code]
+        most_voted = match.leaders
+        if not most_voted:
             return None
 
-        max_votes = max(vote_counts.values())
-        most_voted = [pid for pid, count in vote_counts.items() if count == max_votes]
+        eliminated_player_id = rng.choice(most_voted)
 
-        eliminated_player_id = random.choice(most_voted)
+        eliminated_player = match.players[eliminated_player_id]
+        eliminated_player_role = eliminated_player.role
+        eliminated_player_name = eliminated_player.name
 
-        eliminated_player_role = matches[match_code]["players"][eliminated_player_id][
-            "role"
-        ]
-        eliminated_player_name = matches[match_code]["players"][eliminated_player_id][
-            "name"
-        ]
-
-        matches[match_code]["players"][eliminated_player_id]["alive"] = False
+        match.set_alive(eliminated_player_id, False)
+        match.set_phase("reveal")
+        event_log.emit(
+            "player_eliminated",
+            match=match_code,
+            player=eliminated_player_id,
+            role=eliminated_player_role,
+            round=match.round,
+        )
 
         reveal_message = {
             "type": "reveal_result",
@@ -87,36 +84,76 @@ class VoteManager:
     @staticmethod
     def _count_alive_by_role(match_code: str) -> tuple[int, int]:
         """Count alive impostors and normal players. Returns (impostors, normal)"""
-        alive_impostors = 0
-        alive_normal = 0
-
-        for pid, player_data in matches[match_code]["players"].items():
-            if player_data["alive"]:
-                if player_data["role"] == "impostor":
-                    alive_impostors += 1
-                else:
-                    alive_normal += 1
-
-        return alive_impostors, alive_normal
+        match = matches[match_code]
+        return match.alive_impostors, match.alive_count - match.alive_impostors
 
     @staticmethod
     async def _check_win_conditions_and_continue(match_code: str):
         """Check win conditions and either end game or continue to next round"""
+        if match_code not in matches:
+            return
+
         alive_impostors, alive_normal = VoteManager._count_alive_by_role(match_code)
         total_alive = alive_impostors + alive_normal
 
         if alive_impostors >= (total_alive / 2):
-            game_over_message = {"type": "game_over", "winner": "impostor"}
-            await WebSocketManager.broadcast_to_match(match_code, game_over_message)
-            await WebSocketManager.broadcast_phase_change(match_code, "game_over")
+            await VoteManager._end_game(match_code, "impostor")
         elif alive_impostors == 0:
-            game_over_message = {"type": "game_over", "winner": "normal"}
-            await WebSocketManager.broadcast_to_match(match_code, game_over_message)
-            await WebSocketManager.broadcast_phase_change(match_code, "game_over")
+            await VoteManager._end_game(match_code, "normal")
         else:
-            matches[match_code]["round"] += 1
-            matches[match_code]["phase"] = "round"
-            await WebSocketManager.broadcast_phase_change(match_code, "round")
+            matches[match_code].next_round()
+            await PhaseManager.start_discussion(match_code, "round")
+
+    @staticmethod
+    async def _end_game(match_code: str, winner: str):
+        """Finish the match and announce the winner"""
+        match = matches[match_code]
+        match.set_phase("game_over")
+        # Only the phase timer: players who dropped out are still removed once
+        # their reconnect grace period ends
+        scheduler.cancel(match_code, "phase")
+        event_log.emit("game_over", match=match_code, winner=winner, round=match.round)
+
+        game_over_message = {"type": "game_over", "winner": winner}
+        await WebSocketManager.broadcast_to_match(match_code, game_over_message)
+        await WebSocketManager.broadcast_phase_change(match_code, "game_over")
+
+    @staticmethod
+    async def close_voting(match_code: str):
+        """Resolve the votes cast so far and schedule the next round or game over"""
+        match = matches.get(match_code)
+        if match is None or match.phase != "voting":
+            return
+
+        scheduler.cancel(match_code, "phase")
+        eliminated_player_id = await VoteManager._process_elimination(match_code)
+        match.clear_votes()
+
+        if eliminated_player_id is None:
+            await VoteManager._check_win_conditions_and_continue(match_code)
+            return
+
+        # Leave the reveal on screen before going to next round/game over
+        scheduler.schedule(
+            match_code,
+            "phase",
+            REVEAL_DURATION,
+            partial(VoteManager._check_win_conditions_and_continue, match_code),
+        )
+
+    @staticmethod
+    async def _broadcast_tally(match_code: str):
+        """Push the running vote tally to the match, if enabled"""
+        if not LIVE_VOTE_TALLY:
+            return
+
+        match = matches[match_code]
+        tally_message = {
+            "type": "vote_tally",
+            "votes": match.vote_counts,
+            "votes_cast": match.votes_cast,
+        }
+        await WebSocketManager.broadcast_to_match(match_code, tally_message)
 
     @staticmethod
     async def handle_vote(match_code: str, player_id: str, target_id: str):
@@ -124,12 +161,24 @@ class VoteManager:
         if not VoteManager._validate_vote(match_code, player_id):
             return
 
+        if not VoteManager._validate_target(match_code, target_id):
+            return
+
         VoteManager._store_vote(match_code, player_id, target_id)
+        event_log.emit(
+            "vote_cast", match=match_code, player=player_id, target=target_id
+        )
 
         if VoteManager._all_players_voted(match_code):
-            await VoteManager._process_elimination(match_code)
-            matches[match_code]["votes"] = {}
-            await asyncio.sleep(
-                5
-            )  # wait 5 seconds before going to next round/game over
-            await VoteManager._check_win_conditions_and_continue(match_code)
+            await VoteManager.close_voting(match_code)
+        else:
+            await VoteManager._broadcast_tally(match_code)
+
+    @staticmethod
+    async def handle_vote_retraction(match_code: str, player_id: str):
+        """Withdraw a player's vote while voting is still open"""
+        if not VoteManager._validate_vote(match_code, player_id):
+            return
+
+        matches[match_code].retract_vote(player_id)
+        await VoteManager._broadcast_tally(match_code)
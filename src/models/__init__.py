@@ -1,3 +1,16 @@
-from .requests import JoinMatchRequest, StartMatchRequest
+from .requests import (
+    CreateMatchRequest,
+    JoinMatchRequest,
+    QuickMatchRequest,
+    StartMatchRequest,
+)
+from .match import Match, Player
 
-__all__ = ["JoinMatchRequest", "StartMatchRequest"]
+__all__ = [
+    "CreateMatchRequest",
+    "JoinMatchRequest",
+    "QuickMatchRequest",
+    "StartMatchRequest",
+    "Match",
+    "Player",
+]
@@ -0,0 +1,401 @@
+import functools
+import itertools
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+# Shared by every match, so a version is never reused even when a code is
+_versions = itertools.count(1)
+
+# Called as recorder(match_code, method, args, kwargs) after each journaled
+# mutation, e.g. to persist it. Only outermost mutator calls are recorded
+Recorder = Callable[[str, str, tuple, dict], None]
+_recorder: Recorder | None = None
+_recording = False
+
+
+def set_recorder(recorder: Recorder | None):
+    """Start or stop reporting match mutations"""
+    global _recorder
+    _recorder = recorder
+
+
+def reserve_version() -> int:
+    """A version above every version handed out so far"""
+    return next(_versions)
+
+
+def restore_versions(floor: int):
+    """Continue versions from floor, e.g. after restoring matches from disk"""
+    global _versions
+    _versions = itertools.count(floor)
+
+
+def journaled(method):
+    """Report calls of a Match mutator to the recorder, if one is set"""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        global _recording
+        if _recorder is None or _recording:
+            return method(self, *args, **kwargs)
+
+        _recording = True
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            _recording = False
+        _recorder(self.code, name, args, kwargs)
+        return result
+
+    return wrapper
+
+
+@dataclass(slots=True)
+class Player:
+    """A player in a match. Mutate through Match so its counters stay in sync"""
+
+    name: str
+    alive: bool = True
+    host: bool = False
+    ready_to_vote: bool = False
+    role: str = "normal"
+    session_token: str = ""  # proves the player's identity when reattaching
+    connections: int = 0  # open sockets, on any worker
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "alive": self.alive,
+            "host": self.host,
+            "ready_to_vote": self.ready_to_vote,
+            "role": self.role,
+            "session_token": self.session_token,
+        }
+
+
+@dataclass(slots=True)
+class Match:
+    """Match state with running counters kept up to date by its mutators
+
+    version advances whenever state visible to clients (phase, round,
+    can_start and the player list) changes, which invalidates snapshot.
+    The changes themselves accumulate in patch_fields/patch_players until
+    take_patch() turns them into a delta from patch_base.
+
+    Mutators marked @journaled are reported to the recorder, and replaying
+    them in order on Match(code) rebuilds the same state.
+    """
+
+    code: str
+    players: dict[str, Player] = field(default_factory=dict)
+    can_start: bool = False
+    phase: str = "lobby"
+    public: bool = False  # listed in the open lobbies and used for quick matches
+    round: int = 1
+    votes: dict[str, str] = field(default_factory=dict)
+    secret_character: str = "Kanye West"
+    propositions: dict[str, str] = field(default_factory=dict)
+    host_id: str | None = None
+    alive_count: int = 0
+    alive_impostors: int = 0
+    ready_count: int = 0  # alive players that are ready to vote
+    vote_counts: dict[str, int] = field(default_factory=dict)
+    # Targets grouped by vote count, so the leaders are always at top_votes
+    vote_buckets: dict[int, dict[str, None]] = field(default_factory=dict)
+    top_votes: int = 0
+    last_active: float = field(default_factory=time.monotonic)
+    joined_count: int = 0  # players that ever joined, used to allocate ids
+    version: int = field(default_factory=lambda: next(_versions))
+    snapshot: object = field(default=None, repr=False, compare=False)
+    patch_base: int = 0
+    patch_fields: dict[str, object] = field(default_factory=dict, repr=False)
+    # Changed fields per player, or None for a player that left
+    patch_players: dict[str, dict | None] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        self.patch_base = self.version
+
+    @property
+    def votes_cast(self) -> int:
+        return len(self.votes)
+
+    @property
+    def leaders(self) -> list[str]:
+        """Targets with the most votes so far"""
+        return list(self.vote_buckets.get(self.top_votes, ()))
+
+    @property
+    def all_ready_to_vote(self) -> bool:
+        return self.alive_count > 0 and self.ready_count == self.alive_count
+
+    @property
+    def all_voted(self) -> bool:
+        return self.alive_count > 0 and self.votes_cast >= self.alive_count
+
+    def changed(self):
+        """Advance the version of the client-visible state"""
+        self.version = next(_versions)
+
+    def _field_changed(self, name: str, value: object):
+        self.patch_fields[name] = value
+        self.changed()
+
+    def _player_changed(self, player_id: str, **fields: object):
+        entry = self.patch_players.get(player_id)
+        if entry is None:
+            self.patch_players[player_id] = fields
+        else:
+            entry.update(fields)
+        self.changed()
+
+    def take_patch(self) -> dict | None:
+        """Client-visible changes since the previous call, or None if there are none"""
+        if self.version == self.patch_base:
+            return None
+
+        patch = {
+            "base_version": self.patch_base,
+            "version": self.version,
+            "changes": self.patch_fields,
+            "players": self.patch_players,
+        }
+        self.patch_base = self.version
+        self.patch_fields = {}
+        self.patch_players = {}
+        return patch
+
+    def to_dict(self) -> dict:
+        """Persistent state of the match. Counters are rebuilt by from_dict"""
+        return {
+            "code": self.code,
+            "players": {
+                player_id: player.to_dict()
+                for player_id, player in self.players.items()
+            },
+            "can_start": self.can_start,
+            "phase": self.phase,
+            "public": self.public,
+            "round": self.round,
+            "votes": self.votes,
+            "secret_character": self.secret_character,
+            "propositions": self.propositions,
+            "host_id": self.host_id,
+            "joined_count": self.joined_count,
+            "version": self.version,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Match":
+        match = cls(
+            code=data["code"],
+            can_start=data["can_start"],
+            phase=data["phase"],
+            public=data.get("public", False),
+            round=data["round"],
+            secret_character=data["secret_character"],
+            propositions=dict(data["propositions"]),
+            host_id=data["host_id"],
+            joined_count=data["joined_count"],
+            version=data["version"],
+        )
+        for player_id, fields in data["players"].items():
+            player = match.players[player_id] = Player(**fields)
+            if player.alive:
+                match.alive_count += 1
+                match.alive_impostors += player.role == "impostor"
+                match.ready_count += player.ready_to_vote
+        for voter_id, target_id in data["votes"].items():
+            match.record_vote(voter_id, target_id)
+        return match
+
+    @journaled
+    def take_join_sequence(self) -> int:
+        """Number of the next player to join, used to allocate their id"""
+        sequence = self.joined_count
+        self.joined_count += 1
+        return sequence
+
+    @journaled
+    def set_proposition(self, player_id: str, proposition: str):
+        self.propositions[player_id] = proposition
+
+    @journaled
+    def set_secret_character(self, character: str):
+        self.secret_character = character
+
+    @journaled
+    def set_public(self, public: bool):
+        self.public = public
+
+    @journaled
+    def set_phase(self, phase: str):
+        self.phase = phase
+        self._field_changed("phase", phase)
+
+    @journaled
+    def next_round(self):
+        self.round += 1
+        self._field_changed("round", self.round)
+
+    @journaled
+    def set_can_start(self, can_start: bool):
+        if self.can_start != can_start:
+            self.can_start = can_start
+            self._field_changed("can_start", can_start)
+
+    @journaled
+    def add_player(
+        self, player_id: str, name: str, host: bool = False, session_token: str = ""
+    ) -> Player:
+        """Add an alive player to the match. The id must not be in use"""
+        if player_id in self.players:
+            raise ValueError(f"Player {player_id} is already in match {self.code}")
+
+        player = Player(name=name, session_token=session_token)
+        self.players[player_id] = player
+        self.alive_count += 1
+        if host:
+            self.set_host(player_id)
+        self.patch_players[player_id] = {
+            "name": player.name,
+            "host": player.host,
+            "ready_to_vote": player.ready_to_vote,
+            "alive": player.alive,
+        }
+        self.changed()
+        return player
+
+    @journaled
+    def remove_player(self, player_id: str) -> Player | None:
+        """Remove a player along with their vote. Returns the removed player"""
+        player = self.players.pop(player_id, None)
+        if player is None:
+            return None
+
+        if player.alive:
+            self.alive_count -= 1
+            if player.role == "impostor":
+                self.alive_impostors -= 1
+            if player.ready_to_vote:
+                self.ready_count -= 1
+
+        if self.host_id == player_id:
+            self.host_id = None
+
+        self.retract_vote(player_id)
+        if player_id in self.vote_counts:
+            for voter, target in list(self.votes.items()):
+                if target == player_id:
+                    self.retract_vote(voter)
+        self.patch_players[player_id] = None
+        self.changed()
+        return player
+
+    @journaled
+    def set_host(self, player_id: str):
+        """Make a player the only host of the match"""
+        if self.host_id in self.players:
+            self.players[self.host_id].host = False
+            self._player_changed(self.host_id, host=False)
+
+        self.players[player_id].host = True
+        self.host_id = player_id
+        self._player_changed(player_id, host=True)
+
+    @journaled
+    def set_ready(self, player_id: str, ready: bool):
+        """Set a player's voting readiness"""
+        # Counted by truthiness, so any truthy value must count once
+        ready = bool(ready)
+        player = self.players[player_id]
+        if player.ready_to_vote == ready:
+            return
+
+        player.ready_to_vote = ready
+        if player.alive:
+            self.ready_count += 1 if ready else -1
+        self._player_changed(player_id, ready_to_vote=ready)
+
+    @journaled
+    def reset_readiness(self):
+        """Clear every player's voting readiness"""
+        for player_id, player in self.players.items():
+            if player.ready_to_vote:
+                player.ready_to_vote = False
+                self._player_changed(player_id, ready_to_vote=False)
+        self.ready_count = 0
+
+    @journaled
+    def set_alive(self, player_id: str, alive: bool):
+        """Eliminate or revive a player"""
+        player = self.players[player_id]
+        if player.alive == alive:
+            return
+
+        player.alive = alive
+        delta = 1 if alive else -1
+        self.alive_count += delta
+        if player.role == "impostor":
+            self.alive_impostors += delta
+        if player.ready_to_vote:
+            self.ready_count += delta
+        self._player_changed(player_id, alive=alive)
+
+    @journaled
+    def set_role(self, player_id: str, role: str):
+        """Assign a player's role"""
+        player = self.players[player_id]
+        if player.alive:
+            self.alive_impostors += (role == "impostor") - (player.role == "impostor")
+        player.role = role
+
+    @journaled
+    def record_vote(self, voter_id: str, target_id: str):
+        """Cast or change a vote, updating the tally"""
+        previous = self.votes.get(voter_id)
+        if previous == target_id:
+            return
+
+        if previous is not None:
+            self._move_votes(previous, -1)
+        self.votes[voter_id] = target_id
+        self._move_votes(target_id, 1)
+
+    @journaled
+    def retract_vote(self, voter_id: str):
+        """Withdraw a vote, if one was cast"""
+        target_id = self.votes.pop(voter_id, None)
+        if target_id is not None:
+            self._move_votes(target_id, -1)
+
+    @journaled
+    def clear_votes(self):
+        """Discard every vote and the tally"""
+        self.votes.clear()
+        self.vote_counts.clear()
+        self.vote_buckets.clear()
+        self.top_votes = 0
+
+    def _move_votes(self, target_id: str, delta: int):
+        """Move a target to the next or previous vote bucket"""
+        count = self.vote_counts.get(target_id, 0)
+        if count:
+            bucket = self.vote_buckets[count]
+            del bucket[target_id]
+            if not bucket:
+                del self.vote_buckets[count]
+
+        count += delta
+        if count:
+            self.vote_counts[target_id] = count
+            self.vote_buckets.setdefault(count, {})[target_id] = None
+        else:
+            del self.vote_counts[target_id]
+
+        if count > self.top_votes:
+            self.top_votes = count
+        elif self.top_votes not in self.vote_buckets:
+            # Only a single step down can empty the top bucket
+            self.top_votes = count
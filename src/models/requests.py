@@ -1,6 +1,10 @@
 from pydantic import BaseModel
 
 
+class CreateMatchRequest(BaseModel):
+    public: bool = False
+
+
 class JoinMatchRequest(BaseModel):
     name: str
     match_code: str
@@ -8,3 +12,7 @@ class JoinMatchRequest(BaseModel):
 
 class StartMatchRequest(BaseModel):
     match_code: str
+
+
+class QuickMatchRequest(BaseModel):
+    name: str
@@ -0,0 +1,41 @@
+import os
+
+# Settings are read on import, so configure them before the app is imported
+os.environ.setdefault("EVENT_LOG", "")
+os.environ.setdefault("JOURNAL_DIR", "")
+
+import pytest  # noqa: E402
+
+from src.core.lobbies import lobby_index  # noqa: E402
+from src.core.scheduler import scheduler  # noqa: E402
+from src.core.state import (  # noqa: E402
+    active_connections,
+    evicted_matches,
+    matches,
+    player_connections,
+    spectator_feeds,
+    websocket_to_player,
+)
+
+
+def clear_registries():
+    for match_code in matches:
+        scheduler.cancel_match(match_code)
+        lobby_index.discard(match_code)
+    for registry in (
+        matches,
+        evicted_matches,
+        active_connections,
+        websocket_to_player,
+        player_connections,
+        spectator_feeds,
+    ):
+        registry.clear()
+
+
+@pytest.fixture(autouse=True)
+def clean_registries():
+    """Give every test empty match and connection registries"""
+    clear_registries()
+    yield
+    clear_registries()
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from src.core import actor
+from src.core.actor import MatchActor
+from src.core.websocket import WebSocketManager
+
+
+def test_commands_of_a_match_run_one_at_a_time_in_order():
+    log = []
+
+    def command(index: int):
+        async def apply():
+            log.append(("start", index))
+            # Yield mid-command, giving any other command the chance to interleave
+            await asyncio.sleep(0)
+            log.append(("end", index))
+            return index
+
+        return apply
+
+    async def run_all():
+        return await asyncio.gather(
+            *(MatchActor.run("ABCD01", command(index)) for index in range(5))
+        )
+
+    assert asyncio.run(run_all()) == list(range(5))
+    assert log == [(step, index) for index in range(5) for step in ("start", "end")]
+
+
+def test_state_is_flushed_once_per_batch(monkeypatch):
+    flushed = []
+    monkeypatch.setattr(actor, "ACTOR_BATCH_SIZE", 4)
+    monkeypatch.setattr(WebSocketManager, "flush_match_state", flushed.append)
+
+    async def noop():
+        pass
+
+    async def run_all():
+        for _ in range(9):
+            MatchActor.post("ABCD01", noop)
+        await MatchActor.run("ABCD01", noop)
+
+    asyncio.run(run_all())
+
+    # 10 commands in batches of 4, 4 and 2
+    assert flushed == ["ABCD01"] * 3
+
+
+def test_a_failing_command_does_not_stop_the_others():
+    async def fail():
+        raise ValueError("boom")
+
+    async def succeed():
+        return "ok"
+
+    async def run_both():
+        failing = MatchActor.run("ABCD01", fail)
+        return await asyncio.gather(
+            failing, MatchActor.run("ABCD01", succeed), return_exceptions=True
+        )
+
+    failure, result = asyncio.run(run_both())
+
+    assert isinstance(failure, ValueError)
+    assert result == "ok"
+
+
+@pytest.fixture(autouse=True)
+def no_actors_left():
+    yield
+    assert not actor._actors
@@ -0,0 +1,46 @@
+import time
+
+from src.core import heartbeat
+from src.core.heartbeat import PING_FRAME, HeartbeatManager
+from src.core.state import websocket_to_player
+
+
+class FakeWebSocket:
+    """Stands in for the websocket a connection is registered under"""
+
+
+class FakeConnection:
+    def __init__(self, last_seen: float):
+        self.last_seen = last_seen
+        self.sent = []
+        self.closed_with = None
+
+    def send(self, frame):
+        self.sent.append(frame)
+
+    def close(self, code: int = 1000, reason: str | None = None):
+        self.closed_with = code
+
+
+def test_sweep_closes_silent_sockets(monkeypatch):
+    monkeypatch.setattr(heartbeat, "HEARTBEAT_TIMEOUT", 45.0)
+    silent = FakeConnection(time.monotonic() - 60)
+    alive = FakeConnection(time.monotonic())
+    websocket_to_player.update({FakeWebSocket(): silent, FakeWebSocket(): alive})
+
+    assert HeartbeatManager.sweep() == 1
+
+    assert silent.closed_with == heartbeat.HEARTBEAT_TIMEOUT_CLOSE_CODE
+    assert alive.closed_with is None
+    assert alive.sent == [PING_FRAME]
+
+
+def test_sweep_never_closes_when_timeout_disabled(monkeypatch):
+    monkeypatch.setattr(heartbeat, "HEARTBEAT_TIMEOUT", 0.0)
+    silent = FakeConnection(time.monotonic() - 3600)
+    websocket_to_player[FakeWebSocket()] = silent
+
+    assert HeartbeatManager.sweep() == 0
+
+    assert silent.closed_with is None
+    assert silent.sent == [PING_FRAME]
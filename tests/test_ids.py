@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+from src.core.ids import MatchCodeAllocator, Permutation
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 16, 17, 100, 1000, 4099])
+def test_permutation_is_a_bijection_and_inverts(size):
+    permutation = Permutation(size, random.Random(size))
+
+    images = [permutation.apply(value) for value in range(size)]
+
+    assert sorted(images) == list(range(size))
+    assert [permutation.invert(image) for image in images] == list(range(size))
+
+
+def test_worker_stripes_never_collide_and_keep_their_owner():
+    workers = [
+        MatchCodeAllocator(seed=7, worker_id=worker_id, worker_count=3)
+        for worker_id in range(3)
+    ]
+    codes: dict[str, int] = {}
+    for worker_id, allocator in enumerate(workers):
+        for _ in range(1000):
+            code = allocator.allocate(codes)
+            assert MatchCodeAllocator.is_well_formed(code)
+            codes[code] = worker_id
+
+    assert len(codes) == 3000
+    for code, worker_id in codes.items():
+        assert workers[0].owner_of(code) == worker_id
+
+
+def test_released_codes_are_reused_only_after_the_quarantine():
+    allocator = MatchCodeAllocator(seed=7, quarantine=3)
+    released = [allocator.allocate(()) for _ in range(4)]
+
+    for code in released[:3]:
+        allocator.release(code)
+    assert allocator.allocate(()) not in released
+
+    allocator.release(released[3])
+    assert allocator.allocate(()) == released[0]
+
+
+def test_released_codes_still_in_use_are_skipped():
+    allocator = MatchCodeAllocator(seed=7, quarantine=0)
+    first, second = allocator.allocate(()), allocator.allocate(())
+    allocator.release(first)
+    allocator.release(second)
+
+    assert allocator.allocate({first}) == second
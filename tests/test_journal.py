@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from src.core.journal import Journal
+from src.core.state import matches
+from src.models import Match
+
+COUNTERS = ("alive_count", "alive_impostors", "ready_count", "top_votes", "version")
+
+
+def state():
+    """Everything replay must reproduce, by match code"""
+    return {
+        match_code: (
+            match.to_dict(),
+            {name: getattr(match, name) for name in COUNTERS},
+            dict(match.vote_counts),
+        )
+        for match_code, match in matches.items()
+    }
+
+
+@pytest.fixture
+def journal(tmp_path):
+    """A started journal, closed even if the test fails"""
+    journal = Journal(str(tmp_path), 0)
+    journal.start()
+    yield journal
+    journal.close()
+
+
+def play(journal: Journal, match_code: str):
+    """Create a match and take it into voting, journaling every step"""
+    match = matches[match_code] = Match(code=match_code)
+    journal.record(match_code, "create")
+    for index, player_id in enumerate("abcd"):
+        match.add_player(player_id, player_id, host=index == 0, session_token="t")
+        match.set_role(player_id, "impostor" if player_id == "a" else "Batman")
+    match.set_phase("round")
+    match.set_ready("b", True)
+    match.set_phase("voting")
+    match.record_vote("a", "b")
+    match.record_vote("c", "b")
+    match.retract_vote("c")
+
+
+def restart(directory) -> Journal:
+    """Forget every match and restore them as a new process would"""
+    matches.clear()
+    journal = Journal(str(directory), 0)
+    journal.restore()
+    return journal
+
+
+def test_replay_rebuilds_matches_and_counters(tmp_path, journal):
+    play(journal, "ABCD01")
+    play(journal, "ABCD02")
+    matches["ABCD02"].remove_player("c")
+    journal.record("ABCD01", "drop")
+    matches.pop("ABCD01")
+    journal.close()
+    expected = state()
+
+    restart(tmp_path)
+
+    assert state() == expected
+
+
+def test_snapshot_truncates_and_replay_skips_covered_records(tmp_path, journal):
+    play(journal, "ABCD01")
+    journal.snapshot()
+    matches["ABCD01"].set_phase("reveal")
+    journal.close()
+    expected = state()
+
+    lines = (tmp_path / "journal-0.log").read_bytes().splitlines()
+    records = [json.loads(line) for line in lines]
+    snapshot = json.loads((tmp_path / "snapshot-0.json").read_bytes())
+    # Only the record made after the snapshot is left in the journal
+    assert [record["op"] for record in records] == ["set_phase"]
+    assert records[0]["s"] > snapshot["sequence"]
+
+    # A record the snapshot already includes must not be applied again
+    stale = {"s": snapshot["sequence"], "m": "ABCD01", "op": "set_phase"}
+    stale.update(a=["lobby"], k={}, v=1)
+    with open(tmp_path / "journal-0.log", "ab") as journal_file:
+        journal_file.write(json.dumps(stale).encode() + b"\n")
+
+    restart(tmp_path)
+
+    assert state() == expected
+
+
+def test_torn_final_record_is_ignored(tmp_path, journal):
+    play(journal, "ABCD01")
+    journal.close()
+    expected = state()
+
+    with open(tmp_path / "journal-0.log", "ab") as journal_file:
+        journal_file.write(b'{"s":999,"m":"ABCD01","op":"set_ph')
+
+    restart(tmp_path)
+
+    assert state() == expected
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from src.core.ids import player_id_for
+from src.core.match import MatchManager
+from src.core.state import matches
+
+
+def test_join_skips_player_ids_in_use():
+    match_code = MatchManager.create_match()
+    match = matches[match_code]
+    # As if restored from a process whose permutation gave out these ids
+    match.add_player(player_id_for(0), "a", host=True)
+    match.add_player(player_id_for(1), "b")
+
+    joined = asyncio.run(MatchManager.join_match(match_code, "c"))
+
+    assert len(match.players) == 3
+    assert match.players[joined["player_id"]].name == "c"
+    assert match.alive_count == 3
+
+
+def test_add_player_rejects_duplicate_ids():
+    match_code = MatchManager.create_match()
+    match = matches[match_code]
+    match.add_player("p1", "a")
+
+    with pytest.raises(ValueError):
+        match.add_player("p1", "b")
+    assert match.alive_count == 1
+
+
+def test_merge_lobby_pages_orders_fullest_first_across_workers():
+    def lobby(code, players):
+        return {"match_code": code, "players": players, "host": None}
+
+    pages = [
+        {"lobbies": [lobby("A", 4), lobby("B", 1)], "total": 2, "next_offset": None},
+        {"lobbies": [lobby("C", 4), lobby("D", 3)], "total": 3, "next_offset": 2},
+    ]
+
+    first = MatchManager.merge_lobby_pages(pages, 0, 3)
+    assert [entry["match_code"] for entry in first["lobbies"]] == ["A", "C", "D"]
+    assert first["total"] == 5
+    assert first["next_offset"] == 3
+
+    last = MatchManager.merge_lobby_pages(pages, 3, 3)
+    assert [entry["match_code"] for entry in last["lobbies"]] == ["B"]
+    assert last["next_offset"] == 4
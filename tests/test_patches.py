@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+from src.core.match import MatchManager
+from src.core.snapshot import Snapshot
+from src.core.state import active_connections, matches
+from src.core.websocket import WebSocketManager
+
+
+class DeltaClient:
+    """A delta connection that applies every patch it is sent, as a client would"""
+
+    delta = True
+
+    def __init__(self, full_frame: str):
+        self.state = json.loads(full_frame)
+        del self.state["type"]
+        self.patches = 0
+
+    def send(self, frame: str) -> int:
+        patch = json.loads(frame)
+        assert patch["type"] == "match_state_patch"
+        # A patch may start before the full state the client began from
+        assert patch["base_version"] <= self.state["version"] < patch["version"]
+
+        self.state.update(patch["changes"])
+        self.state["version"] = patch["version"]
+        players = {player["id"]: player for player in self.state["players"]}
+        for player_id, fields in patch["players"].items():
+            if fields is None:
+                players.pop(player_id, None)
+            elif player_id in players:
+                players[player_id].update(fields)
+            else:
+                players[player_id] = {"id": player_id, **fields}
+        self.state["players"] = list(players.values())
+        self.patches += 1
+        return 1
+
+
+def test_patches_rebuild_the_full_state():
+    async def play():
+        match_code = MatchManager.create_match()
+        match = matches[match_code]
+        host = await MatchManager.join_match(match_code, "a")
+        # Connects after a change that has not been broadcast yet
+        client = DeltaClient(Snapshot.of(match).frame)
+        active_connections[match_code] = [client]
+
+        async def flush():
+            # As handlers do after changing a match
+            await WebSocketManager.broadcast_match_state(match_code)
+            WebSocketManager.flush_match_state(match_code)
+            assert client.state == Snapshot.of(match).info
+
+        joined = [await MatchManager.join_match(match_code, name) for name in "bc"]
+        await flush()
+
+        match.set_ready(joined[0]["player_id"], True)
+        match.set_proposition(joined[1]["player_id"], "Batman")
+        match.set_can_start(True)
+        await flush()
+
+        # The host leaves, so the host moves to the next player
+        await MatchManager.remove_player(match_code, host["player_id"])
+        await flush()
+
+        await MatchManager.join_match(match_code, "d")
+        await MatchManager.remove_player(match_code, joined[1]["player_id"])
+        await flush()
+
+        match.set_phase("round")
+        match.next_round()
+        await flush()
+        return client
+
+    client = asyncio.run(play())
+
+    assert client.patches == 5
+    assert client.state["players"][0]["host"]
@@ -0,0 +1,56 @@
+import asyncio
+
+from src.core.match import MatchManager
+from src.core.state import matches
+
+
+def started_match(phase: str) -> str:
+    """A match of five players, a being the impostor, in the given phase"""
+    match_code = MatchManager.create_match()
+    match = matches[match_code]
+    for index, player_id in enumerate("abcde"):
+        match.add_player(player_id, player_id, host=index == 0)
+        match.set_role(player_id, "impostor" if player_id == "a" else "Batman")
+    match.set_phase(phase)
+    return match_code
+
+
+def test_leaving_completes_the_vote():
+    match_code = started_match("voting")
+    match = matches[match_code]
+    for voter, target in (("a", "b"), ("b", "c"), ("c", "b"), ("d", "b")):
+        match.record_vote(voter, target)
+
+    asyncio.run(MatchManager.remove_player(match_code, "e"))
+
+    assert match.phase == "reveal"
+    assert not match.players["b"].alive
+
+
+def test_leaving_completes_discussion_readiness():
+    match_code = started_match("round")
+    match = matches[match_code]
+    for player_id in "abcd":
+        match.set_ready(player_id, True)
+
+    asyncio.run(MatchManager.remove_player(match_code, "e"))
+
+    assert match.phase == "voting"
+
+
+def test_impostor_leaving_ends_the_game():
+    match_code = started_match("round")
+
+    asyncio.run(MatchManager.remove_player(match_code, "a"))
+
+    assert matches[match_code].phase == "game_over"
+
+
+def test_leaving_an_undecided_phase_changes_nothing():
+    match_code = started_match("voting")
+    match = matches[match_code]
+    match.record_vote("a", "b")
+
+    asyncio.run(MatchManager.remove_player(match_code, "e"))
+
+    assert match.phase == "voting"
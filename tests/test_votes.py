@@ -0,0 +1,64 @@
+import random
+from collections import Counter
+
+import pytest
+
+from src.models import Match
+
+
+def assert_tally_matches_recount(match: Match):
+    counts = Counter(match.votes.values())
+    buckets: dict[int, set[str]] = {}
+    for target, count in counts.items():
+        buckets.setdefault(count, set()).add(target)
+    top = max(counts.values(), default=0)
+
+    assert match.vote_counts == dict(counts)
+    assert {count: set(bucket) for count, bucket in match.vote_buckets.items()} == (
+        buckets
+    )
+    assert match.top_votes == top
+    assert set(match.leaders) == buckets.get(top, set())
+
+
+def test_removing_a_player_drops_their_vote_and_the_votes_for_them():
+    match = Match(code="ABCD01")
+    for player_id in "abcd":
+        match.add_player(player_id, player_id)
+    match.record_vote("a", "b")
+    match.record_vote("c", "b")
+    match.record_vote("b", "d")
+
+    match.remove_player("b")
+
+    assert match.votes == {}
+    assert_tally_matches_recount(match)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_tally_matches_a_recount_after_any_sequence(seed):
+    chance = random.Random(seed)
+    match = Match(code="ABCD01")
+    joined = 0
+
+    def join():
+        nonlocal joined
+        match.add_player(f"p{joined}", f"p{joined}")
+        joined += 1
+
+    for _ in range(6):
+        join()
+
+    for _ in range(200):
+        players = list(match.players)
+        action = chance.random()
+        if action < 0.6:
+            match.record_vote(chance.choice(players), chance.choice(players))
+        elif action < 0.85:
+            match.retract_vote(chance.choice(players))
+        elif action < 0.95:
+            match.remove_player(chance.choice(players))
+            join()
+        else:
+            match.clear_votes()
+        assert_tally_matches_recount(match)